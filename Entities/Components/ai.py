@@ -6,6 +6,8 @@ from typing import List, Optional, Tuple, TYPE_CHECKING
 import numpy as np  # type: ignore
 import tcod
 
+from Map import path_hierarchy
+from Map.influence_maps import InfluenceMaps
 from UI import color
 from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction, FreezeSpellAction, MawSpellAction, \
     DrainSpellAction
@@ -27,17 +29,19 @@ class BaseAI(Action):
 
         If there is no valid path then returns an empty list.
         """
+        gamemap = self.entity.gamemap
+        if gamemap.width * gamemap.height >= path_hierarchy.MIN_CELLS:
+            return gamemap.path_hierarchy.path((self.entity.x, self.entity.y), (dest_x, dest_y))
+
         # Copy the walkable array.
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
+        walkable = gamemap.tiles["walkable"]
+        cost = np.array(walkable, dtype=np.int8)
 
-        for entity in self.entity.gamemap.entities:
-            # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways.  A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += 10
+        # Add to the cost of a blocked position that is otherwise walkable.
+        # A lower number means more enemies will crowd behind each other in
+        # hallways.  A higher number means enemies will take longer paths in
+        # order to surround the player.
+        cost[gamemap.blocked & walkable] += 10
 
         # Create a graph from the cost array and pass that graph to a new pathfinder.
         graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
@@ -51,13 +55,42 @@ class BaseAI(Action):
         # Convert from List[List[int]] to List[Tuple[int, int]].
         return [(index[0], index[1]) for index in path]
 
+    def step_along_path(self) -> None:
+        """Take the next step of `self.path`.
+
+        During the enemy turns the step is only requested, the engine's crowd
+        movement phase decides which actor gets which cell once everyone has
+        acted.
+        """
+        dest_x, dest_y = self.path.pop(0)
+        crowd_movement = self.engine.crowd_movement
+        if crowd_movement is not None:
+            return crowd_movement.request(self.entity, (dest_x, dest_y), self.path)
+        return MovementAction(
+            self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
+        ).perform()
+
+    def step_downhill(self, field: np.ndarray, bump: bool = False) -> None:
+        """Take one step towards the lowest neighbouring value of an influence
+        map, or wait if already at the bottom."""
+        step = InfluenceMaps.downhill_step(field, self.entity.x, self.entity.y)
+        if step is None:
+            return WaitAction(self.entity).perform()
+        if bump:
+            return BumpAction(self.entity, *step).perform()
+        return MovementAction(self.entity, *step).perform()
+
 
 class HostileEnemy(BaseAI):
-    MAX_DISTANCE = 12
+    """
+    Attacks the player on sight. Until then it idles, unless it hears a noise,
+    in which case it wakes up and walks towards the sound.
+    """
 
     def __init__(self, entity: Actor):
         super().__init__(entity)
         self.path: List[Tuple[int, int]] = []
+        self.following_noise = False
 
     def attack_action(self, distance, dx, dy, target=None) -> None:
         if distance <= 1:
@@ -68,67 +101,70 @@ class HostileEnemy(BaseAI):
 
         dx = target.x - self.entity.x
         dy = target.y - self.entity.y
-        distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
+        distance = self.entity.player_distance  # Chebyshev distance, from GameMap.update_perception.
 
-        if self.engine.game_map.visible[self.entity.x, self.entity.y] and distance < self.MAX_DISTANCE:
-            a = self.attack_action(distance, dx, dy)
+        if self.entity.sees_player:
+            a = self.attack_action(distance, dx, dy, target)
             if a: return a
+
+            if self.keeps_distance(target):
+                # Back off to casting range instead of closing to melee.
+                self.path = []
+                self.before_move()
+                return self.step_downhill(
+                    self.engine.influence_maps.preferred_range(target, self.range)
+                )
             self.path = self.get_path_to(target.x, target.y)
+            self.following_noise = False
+        else:
+            self.listen()
 
-        if distance < self.MAX_DISTANCE and self.path:
-            dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
+        self.before_move()
+        if self.path and (self.following_noise or distance < self.entity.sight_radius):
+            return self.step_along_path()
 
         return WaitAction(self.entity).perform()
 
+    def listen(self) -> None:
+        """Head towards any noise heard this turn."""
+        path = self.engine.game_map.path_to_noise(self.entity.x, self.entity.y)
+        if path:
+            self.path = path
+            self.following_noise = True
 
-class IceSpellEnemy(HostileEnemy):
-    MAX_DISTANCE = 12
+    def before_move(self) -> None:
+        """Called each turn the enemy didn't attack, before it moves."""
+        pass
+
+    def keeps_distance(self, target: Actor) -> bool:
+        """True if this enemy would rather stay `self.range` away from `target` this turn."""
+        return False
 
+
+class IceSpellEnemy(HostileEnemy):
     def __init__(self, entity: Actor, range: int = 5):
         super().__init__(entity)
         self.range = range
 
     def attack_action(self, distance, dx, dy, target=None) -> None:
-        if distance <= self.range and not any(x.name == "Frost Shock" for x in target.status_effects):
+        if distance <= self.range and not target.has_status("Frost Shock"):
             return FreezeSpellAction(self.entity, dx, dy, 1).perform()
         elif distance <= 1:
             return MeleeAction(self.entity, dx, dy).perform()
 
-    def perform(self) -> None:
-        target = self.engine.player
-
-        dx = target.x - self.entity.x
-        dy = target.y - self.entity.y
-        distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
-
-        if self.engine.game_map.visible[self.entity.x, self.entity.y] and distance < self.MAX_DISTANCE:
-            a = self.attack_action(distance, dx, dy, target)
-            if a: return a
-
-            self.path = self.get_path_to(target.x, target.y)
-
-        if distance < self.MAX_DISTANCE and self.path:
-            dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
-
-        return WaitAction(self.entity).perform()
+    def keeps_distance(self, target: Actor) -> bool:
+        # Kite while the spell is still on the target.
+        return target.has_status("Frost Shock")
 
 
 class IceSentryBossEnemy(HostileEnemy):
-    MAX_DISTANCE = 12
-
     def __init__(self, entity: Actor, range: int = 5):
         super().__init__(entity)
         self.range = range
         self.drain_cooldown=0
 
     def attack_action(self, distance, dx, dy, target=None) -> None:
-        if distance <= self.range and not any(x.name == "Frost Shock" for x in target.status_effects):
+        if distance <= self.range and not target.has_status("Frost Shock"):
             return FreezeSpellAction(self.entity, dx, dy, 2).perform()
         if distance <= 1 and self.engine.player.fighter.power > 5 and self.drain_cooldown==0:
             self.drain_cooldown=5
@@ -136,99 +172,38 @@ class IceSentryBossEnemy(HostileEnemy):
         elif distance <= 1:
             return MeleeAction(self.entity, dx, dy).perform()
 
-    def perform(self) -> None:
-        target = self.engine.player
-
-        dx = target.x - self.entity.x
-        dy = target.y - self.entity.y
-        distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
-
-        if self.engine.game_map.visible[self.entity.x, self.entity.y] and distance < self.MAX_DISTANCE:
-            a = self.attack_action(distance, dx, dy, target)
-            if a:
-                return a
-
-            self.path = self.get_path_to(target.x, target.y)
+    def before_move(self) -> None:
         if self.drain_cooldown>0:
             self.drain_cooldown-=1
-        if distance < self.MAX_DISTANCE and self.path:
-            dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
 
-        return WaitAction(self.entity).perform()
+    def keeps_distance(self, target: Actor) -> bool:
+        # Only close in once the drain is ready again.
+        return target.has_status("Frost Shock") and self.drain_cooldown > 0
 
 
 class RatMunchEnemy(HostileEnemy):
-    MAX_DISTANCE = 12
-
     def __init__(self, entity: Actor, range: int = 5):
         super().__init__(entity)
         self.range = range
 
     def attack_action(self, distance, dx, dy, target=None) -> None:
-        if distance <= 1 and not any(x.name == "Maw Siphon" for x in target.status_effects):
+        if distance <= 1 and not target.has_status("Maw Siphon"):
             return MawSpellAction(self.entity, dx, dy, 1).perform()
         elif distance <= 1:
             return MeleeAction(self.entity, dx, dy).perform()
 
-    def perform(self) -> None:
-        target = self.engine.player
-
-        dx = target.x - self.entity.x
-        dy = target.y - self.entity.y
-        distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
-
-        if self.engine.game_map.visible[self.entity.x, self.entity.y] and distance < self.MAX_DISTANCE:
-            a = self.attack_action(distance, dx, dy, target)
-            if a: return a
-
-            self.path = self.get_path_to(target.x, target.y)
-
-        if distance < self.MAX_DISTANCE and self.path:
-            dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
-
-        return WaitAction(self.entity).perform()
-
 
 class BeastMunchEnemy(HostileEnemy):
-    MAX_DISTANCE = 12
-
     def __init__(self, entity: Actor, range: int = 5):
         super().__init__(entity)
         self.range = range
 
     def attack_action(self, distance, dx, dy, target=None) -> None:
-        if distance <= 1 and not any(x.name == "Maw Siphon" for x in target.status_effects):
+        if distance <= 1 and not target.has_status("Maw Siphon"):
             return MawSpellAction(self.entity, dx, dy, 2).perform()
         elif distance <= 1:
             return MeleeAction(self.entity, dx, dy).perform()
 
-    def perform(self) -> None:
-        target = self.engine.player
-
-        dx = target.x - self.entity.x
-        dy = target.y - self.entity.y
-        distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
-
-        if self.engine.game_map.visible[self.entity.x, self.entity.y] and distance < self.MAX_DISTANCE:
-            a = self.attack_action(distance, dx, dy, target)
-            if a: return a
-
-            self.path = self.get_path_to(target.x, target.y)
-
-        if distance < self.MAX_DISTANCE and self.path:
-            dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
-
-        return WaitAction(self.entity).perform()
-
 
 class PlayerAI(BaseAI):
     def __init__(self, entity: Actor):
@@ -337,32 +312,14 @@ class FearedEnemy(BaseAI):
             )
             self.entity.ai = self.previous_ai
         else:
-            target = self.fear_source
-            # loop though all tiles surrounding monster and find the furthest then move to it
-            max_dist = 0
-            direction_x, direction_y = (0, 0)
-            for ix in range(3):
-                for iy in range(3):
-                    jx = self.entity.x + (ix - 1)
-                    jy = self.entity.y + (iy - 1)
-
-                    dx = target.x - jx
-                    dy = target.y - jy
-                    distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
-                    if distance > max_dist and self.engine.game_map.tiles["walkable"][jx, jy]:
-                        max_dist = distance
-                        direction_x, direction_y = (ix - 1, iy - 1)
-
             self.turns_remaining -= 1
 
-            # The actor will either try to move or attack in the chosen random direction.
-            # Its possible the actor will just bump into the wall, wasting a turn.
-            if not direction_x == 0 and not direction_y == 0 and self.is_magical_fear:
-                return BumpAction(self.entity, direction_x, direction_y).perform()
-            elif not direction_x == 0 and not direction_y == 0:
-                return MovementAction(self.entity, direction_x, direction_y).perform()
-            else:
-                return WaitAction(self.entity).perform()
+            # Walk downhill on the shared safety map, which leads away from the
+            # fear source along open routes instead of into the nearest corner.
+            # Magically feared actors will attack whatever is in their way.
+            return self.step_downhill(
+                self.engine.influence_maps.safety(self.fear_source), bump=self.is_magical_fear
+            )
 
 
 class CharmedEnemy(BaseAI):
@@ -390,35 +347,27 @@ class CharmedEnemy(BaseAI):
             self.entity.ai = self.previous_ai
         else:
             consumer = self.entity
-            target = None
             closest_distance = 18.0
             self.turns_remaining -= 1
 
-            for actor in self.engine.game_map.actors:
-                # Note we check whether the entity is visible
-                # this implicitly means there is a line-of-sight to the entity
-                if actor is not consumer and actor is not self.charmer and self.engine.game_map.visible[
-                    actor.x, actor.y]:
-                    distance = consumer.distance(actor.x, actor.y)
-
-                    if distance < closest_distance:
-                        target = actor
-                        closest_distance = distance
+            # Only visible actors are considered,
+            # this implicitly means there is a line-of-sight to the entity
+            target = self.engine.game_map.nearest_actor(
+                consumer.x, consumer.y, closest_distance,
+                lambda actor: actor is not consumer and actor is not self.charmer,
+            )
             if target:
                 dx = target.x - self.entity.x
                 dy = target.y - self.entity.y
                 distance = max(abs(dx), abs(dy))  # Chebyshev distance. TODO: make this taxicab distance
 
-                if self.engine.game_map.visible[self.entity.x, self.entity.y]:
+                if self.engine.game_map.is_entity_visible(self.entity):
                     self.previous_ai.attack_action(distance, dx, dy, target)
 
                     self.path = self.get_path_to(target.x, target.y)
 
                 if self.path:
-                    dest_x, dest_y = self.path.pop(0)
-                    return MovementAction(
-                        self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-                    ).perform()
+                    return self.step_along_path()
 
                 return WaitAction(self.entity).perform()
             else:
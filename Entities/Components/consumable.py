@@ -63,14 +63,14 @@ class AntivenomConsumable(Consumable):
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
 
-        if any(x.poison for x in consumer.status_effects):
+        poisons = consumer.statuses_in_category("poison")
+        if poisons:
             self.engine.message_log.add_message(
                 f"You consume the {self.parent.name}",
                 color.health_recovered,
             )
-            for effect in consumer.status_effects:
-                if effect.poison:
-                    effect.expire(True)
+            for effect in poisons:
+                effect.expire(True)
             AntivenomImmunityEffect("Poison Resist",1,consumer,20)
             self.consume()
         else:
@@ -83,18 +83,13 @@ class LightningDamageConsumable(Consumable):
 
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
-        target = None
         closest_distance = self.maximum_range + 1.0
 
-        for actor in self.engine.game_map.actors:
-            # Note we check whether the entity is visible
-            # this implicitly means there is a line-of-sight to the entity
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        # Only visible actors are considered,
+        # this implicitly means there is a line-of-sight to the entity
+        target = self.engine.game_map.nearest_actor(
+            consumer.x, consumer.y, closest_distance, lambda actor: actor is not consumer
+        )
 
         if target:
             self.engine.message_log.add_message(
@@ -234,14 +229,14 @@ class FireballDamageConsumable(Consumable):
             raise Impossible("You cannot target an area that you cannot see.")
 
         targets_hit = False
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                self.engine.message_log.add_message(
-                    f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
-                )
-                actor.fighter.take_damage(self.damage)
-                targets_hit = True
+        for actor in self.engine.game_map.actors_within_radius(*target_xy, self.radius):
+            self.engine.message_log.add_message(
+                f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
+            )
+            actor.fighter.take_damage(self.damage)
+            targets_hit = True
 
         if not targets_hit:
             raise Impossible("There are no targets in the radius.")
+        self.engine.game_map.emit_noise(*target_xy, actions.FIREBALL_NOISE)
         self.consume()
\ No newline at end of file
@@ -45,11 +45,10 @@ class Equippable(BaseComponent):
         self.entity = entity
         if self.apply_effect:
             self.apply_effect.apply(self.entity)
-            self.entity.status_effects.append(self.apply_effect)
 
     def unequip(self, entity: Actor):
         if self.apply_effect:
-            self.entity.status_effects.remove(self.apply_effect)
+            self.entity.remove_status_effect(self.apply_effect)
         self.entity = None
 
 
@@ -134,11 +134,9 @@ class Fighter(BaseComponent):
 
     def die(self) -> None:
         if self.engine.player is self.parent:
-            death_message = "You died!"
-            death_message_color = color.player_die
+            self.engine.message_log.add_message("You died!", color.player_die)
         else:
-            death_message = f"{self.parent.name} is dead!"
-            death_message_color = color.enemy_die
+            self.engine.message_log.add_template("dead", color.enemy_die, name=self.parent.name)
 
         self.parent.char = "%"
         self.parent.color = (191, 0, 0)
@@ -146,8 +144,8 @@ class Fighter(BaseComponent):
         self.parent.ai = None
         self.parent.name = f"remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
+        self.parent.on_changed()
 
-        self.engine.message_log.add_message(death_message, death_message_color)
         self.engine.player.level.add_xp(self.parent.level.xp_given)
         
     def heal(self, amount: int) -> int:
@@ -196,9 +194,8 @@ class Fighter(BaseComponent):
 
         n=random.random()
         if self.hp<self.max_hp/3 and n>self.will_chance and self.parent.is_alive:
-            self.engine.message_log.add_message(
-                f"The {self.parent.name} loses its nerve in battle and runs for its life from the {entity.name}!",
-                color.status_effect_applied,
+            self.engine.message_log.add_template(
+                "loses_nerve", color.status_effect_applied, name=self.parent.name, source=entity.name,
             )
             self.parent.ai = FearedEnemy(
                 entity=self.parent, previous_ai=self.parent.ai, turns_remaining=99, fear_source=entity,
@@ -237,8 +234,7 @@ class Fighter(BaseComponent):
                 self.tick_counter=0
 
     def Dodge(self):
-        result = False
-        for skill in self.parent.skills:
-            if skill.name=="Dodge" and skill.level>0:
-                result = skill.dodge(self.parent,self.engine)
-        return result
\ No newline at end of file
+        skill = self.parent.skill_with_name("Dodge")
+        if skill and skill.level>0:
+            return skill.dodge(self.parent,self.engine)
+        return False
\ No newline at end of file
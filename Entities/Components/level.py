@@ -42,7 +42,7 @@ class Level(BaseComponent):
 
         self.current_xp += xp
 
-        self.engine.message_log.add_message(f"You gain {xp} experience points.",color.xp)
+        self.engine.message_log.add_template("gain_xp", color.xp, xp=xp)
 
         if self.requires_level_up:
             self.engine.message_log.add_message(
@@ -48,7 +48,7 @@ class Base_Skill():
 
     def unlockable(self, entity: Actor) -> bool:
         for req_skill in self.prerequisites:
-            if not any(x.name == req_skill.name for x in entity.skills):
+            if not entity.skill_with_name(req_skill.name):
                 return False
         return True
 
@@ -79,16 +79,15 @@ class Skill(Base_Skill):
         if not self.unlockable(entity):
             return False
 
-        if not any(x.name == self.name for x in entity.skills):
-            clone = copy.deepcopy(self)
-            entity.skills.append(clone)
+        skill = entity.skill_with_name(self.name)
+        if not skill:
+            skill = copy.deepcopy(self)
+            entity.add_skill(skill)
 
-        for skill in entity.skills:
-            if skill.name==self.name and self.unlockable(entity) and skill.level<self.max_level:
-                skill.level=skill.level+1
-            elif skill.name==self.name:
-                return False
-        return True
+        if skill.level<self.max_level:
+            skill.level=skill.level+1
+            return True
+        return False
 
     def tick(self):
         raise NotImplementedError()
@@ -240,6 +239,7 @@ class Skill_Charge(Skill):
             )
             actor.ai=StunnedEnemy(actor,actor.ai,stun)
             self.engine.player.fighter.energy-=self.cost
+            self.engine.game_map.emit_noise(actor.x, actor.y, actions.CHARGE_NOISE)
             return actions.MovementAction(
                 self.engine.player, dest_x - self.engine.player.x, dest_y - self.engine.player.y,
             ).perform()
@@ -401,7 +401,7 @@ class Skill_Dodge(Skill):
             x=tile[0]
             y=tile[1]
             passable_tile = entity.gamemap.tiles["walkable"][entity.x+x, entity.y+y]
-            no_entity_in_tile = engine.game_map.get_blocking_entity_at_location(entity.x+x, entity.y+y) is None
+            no_entity_in_tile = not engine.game_map.blocked[entity.x+x, entity.y+y]
             print("dodgeTry",passable_tile,no_entity_in_tile,x,y,entity.x+x, entity.y+y,passable_tile and no_entity_in_tile)
             if passable_tile and no_entity_in_tile:
                 entity.move(x,y)
@@ -477,7 +477,7 @@ class Skill_Jump(Skill):
             raise Impossible("You cannot target an area that you cannot see.")
         if xy_coord[0] == self.engine.player.x and xy_coord[1]==self.engine.player.y:
             raise Impossible("You can't jump to the tile you are in!")
-        if self.engine.game_map.get_blocking_entity_at_location(*xy_coord):
+        if self.engine.game_map.blocked[xy_coord]:
             raise Impossible("That tile is blocked")
         player_skill=self.engine.player.skill_with_name(self.name)
         self.engine.player.fighter.energy-=player_skill.cost
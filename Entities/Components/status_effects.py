@@ -33,7 +33,7 @@ class StatusEffect:
 
     def apply(self,entity: Actor):
         self.entity=entity
-        self.entity.status_effects.append(self)
+        self.entity.add_status_effect(self)
         if self.poison and entity.fighter.resist_poison>0:
             self.magnitude-=entity.fighter.resist_poison
 
@@ -66,7 +66,7 @@ class StatusEffect:
         pass
 
     def expire(self,resisted=False):
-        self.entity.status_effects.remove(self)
+        self.entity.remove_status_effect(self)
 
     def entity_name(self) -> str:
         entity_name="The "+self.entity.name
@@ -94,12 +94,12 @@ class FrostShockStatus(StatusEffect):
         if self.duration%2==0:
             if self.entity.fighter:
                 if self.entity.name=="Player":
-                    self.entity.gamemap.engine.message_log.add_message(
-                        f"You take {self.magnitude} damage from unnatural cold",color.status_effect_applied
+                    self.entity.gamemap.engine.message_log.add_template(
+                        "frost_tick_you",color.status_effect_applied,damage=self.magnitude
                     )
                 else:
-                    self.entity.gamemap.engine.message_log.add_message(
-                        f"{self.entity_name()} takes {self.magnitude} damage from unnatural cold",color.status_effect_applied
+                    self.entity.gamemap.engine.message_log.add_template(
+                        "frost_tick",color.status_effect_applied,name=self.entity_name(),damage=self.magnitude
                     )
                 self.entity.fighter.take_damage(self.magnitude)
 
@@ -216,13 +216,12 @@ class MawSiphonStatus(StatusEffect):
         super().tick()
         if self.duration%2==0 and self.duration>0:
             if self.entity.fighter:
-                self.entity.gamemap.engine.message_log.add_message(
-                    f"{self.magnitude} lifeforce is sucked out of {self.entity_name()} and into the maw",
-                    color.status_effect_applied
+                self.entity.gamemap.engine.message_log.add_template(
+                    "maw_tick",color.status_effect_applied,name=self.entity_name(),damage=self.magnitude
                 )
                 self.entity.fighter.take_damage(self.magnitude)
-                for actor in self.entity.gamemap.actors:
-                    if (actor.name=="Mawrat" and self.entity.gamemap.visible[actor.x,actor.y] and actor.is_alive) or (actor.name=="Mawbeast" and self.entity.gamemap.visible[actor.x,actor.y] and actor.is_alive):
+                for actor in list(self.entity.gamemap.visible_actors):
+                    if actor.name=="Mawrat" or actor.name=="Mawbeast":
 
                         n=random.random()
 
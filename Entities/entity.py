@@ -59,7 +59,7 @@ class Entity:
         if parent:
             # If parent isn't provided now then it will be set later.
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
     @property
     def gamemap(self) -> GameMap:
@@ -71,7 +71,7 @@ class Entity:
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
 
     def place(self, x: int, y: int, gamemap: Optional[GameMap] = None) -> None:
@@ -81,9 +81,11 @@ class Entity:
         if gamemap:
             if hasattr(self, "parent"):  # Possibly uninitialized.
                 if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
+                    self.gamemap.remove_entity(self)
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
+        else:
+            self.on_changed()
 
     def distance(self, x: int, y: int) -> float:
         """
@@ -95,6 +97,13 @@ class Entity:
         # Move the entity by a given amount
         self.x += dx
         self.y += dy
+        self.on_changed()
+
+    def on_changed(self) -> None:
+        """Let the map this entity is on know it moved or changed how it is drawn."""
+        parent = getattr(self, "parent", None)
+        if parent is not None and parent is parent.gamemap:
+            parent.update_entity(self)
 
     def on_press(self,engine:Engine):
         pass
@@ -130,10 +139,7 @@ class PlateEntity(Entity):
 
     def on_press(self,engine:Engine):
         if not self.gamemap.door_open:
-            for x in range(1, self.gamemap.width - 1):
-                for y in range(1, self.gamemap.height - 1):
-                    if self.gamemap.tiles[x,y] == tile_types.door:
-                        self.gamemap.tiles[x, y] = tile_types.door_floor
+            self.gamemap.replace_tiles(tile_types.door, tile_types.door_floor)
             self.gamemap.door_open=True
             text="As you step onto the plate, the great stone door opens up revealing a lavish well-lit room"
             engine.popup_message(title="Reveal",message=text,side_offset=15,textcolor=color.boss)
@@ -171,10 +177,7 @@ class DoorShutTriggerEntity(Entity):
     def on_press(self,engine:Engine):
         if self.gamemap.door_open:
             print("door shut")
-            for x in range(1, self.gamemap.width - 1):
-                for y in range(1, self.gamemap.height - 1):
-                    if self.gamemap.tiles[x,y] == tile_types.door_floor:
-                        self.gamemap.tiles[x, y] = tile_types.door
+            self.gamemap.replace_tiles(tile_types.door_floor, tile_types.door)
             self.gamemap.door_open=False
             text="A beast made from enchanted ice stands up with unnatural-seeming movements from a throne opposite you. The great stone door closes behind you. There's no way back now."
             engine.popup_message(title="Trapped",message=text,side_offset=15,textcolor=color.boss)
@@ -201,6 +204,7 @@ class Actor(Entity):
             skills:List[Skill] = None,
             skill_points:int=0,
             is_boss:bool=False,
+            sight_radius:int=12,
     ):
         super().__init__(
             x=x,
@@ -214,6 +218,12 @@ class Actor(Entity):
             light_level=light_level,
         )
         self.is_boss=is_boss
+        # Monsters notice the player when closer than sight_radius tiles and in
+        # line of sight. GameMap.update_perception fills in the other two once
+        # per turn, until then the player counts as out of range.
+        self.sight_radius = sight_radius
+        self.player_distance = sight_radius
+        self.sees_player = False
 
         self.ai: Optional[BaseAI] = ai_cls(self)
 
@@ -235,27 +245,85 @@ class Actor(Entity):
             self.skills: List[Skill] = []
 
         self.skill_points=skill_points
+        self.reindex()
+
+    STATUS_CATEGORIES = ("poison", "magic", "curse")
+
+    def __getstate__(self):
+        # The lookup tables are rebuilt on demand, so they are left out of saves and copies.
+        state = self.__dict__.copy()
+        state["_skills_by_name"] = None
+        state["_active_skills"] = None
+        state["_status_by_name"] = None
+        state["_status_by_category"] = None
+        return state
+
+    def reindex(self) -> None:
+        """Rebuild the skill and status effect lookup tables from the skill and status effect lists."""
+        self._skills_by_name = {skill.name: skill for skill in self.skills}
+        self._active_skills = [skill for skill in self.skills if skill.active_skill]
+        self._status_by_name = {}
+        self._status_by_category = {category: [] for category in self.STATUS_CATEGORIES}
+        for status in self.status_effects:
+            self._index_status(status)
+
+    def _ensure_index(self) -> None:
+        if self._skills_by_name is None:
+            self.reindex()
+
+    def _index_status(self, status: status_effects.StatusEffect) -> None:
+        self._status_by_name.setdefault(status.name, []).append(status)
+        for category in self.STATUS_CATEGORIES:
+            if getattr(status, category):
+                self._status_by_category[category].append(status)
+
+    def add_skill(self, skill: Skill) -> None:
+        self._ensure_index()
+        self.skills.append(skill)
+        self._skills_by_name.setdefault(skill.name, skill)
+        if skill.active_skill:
+            self._active_skills.append(skill)
+
+    def add_status_effect(self, status: status_effects.StatusEffect) -> None:
+        self._ensure_index()
+        self.status_effects.append(status)
+        self._index_status(status)
+
+    def remove_status_effect(self, status: status_effects.StatusEffect) -> None:
+        self._ensure_index()
+        self.status_effects.remove(status)
+        self._status_by_name[status.name].remove(status)
+        if not self._status_by_name[status.name]:
+            del self._status_by_name[status.name]
+        for category in self.STATUS_CATEGORIES:
+            if getattr(status, category):
+                self._status_by_category[category].remove(status)
 
     def skill_with_name(self,skill_name):
-        for skill in self.skills:
-            if skill.name==skill_name:
-                return skill
-        return False
+        self._ensure_index()
+        return self._skills_by_name.get(skill_name, False)
 
     def status_with_name(self,status_name):
-        for status in self.status_effects:
-            if status.name==status_name:
-                return status
+        self._ensure_index()
+        statuses = self._status_by_name.get(status_name)
+        if statuses:
+            return statuses[0]
         return False
 
+    def has_status(self, status_name: str) -> bool:
+        self._ensure_index()
+        return status_name in self._status_by_name
+
+    def statuses_in_category(self, category: str) -> List[status_effects.StatusEffect]:
+        """Return the status effects flagged as `category` (one of poison, magic or curse)."""
+        self._ensure_index()
+        return list(self._status_by_category[category])
+
     @property
     def active_skills(self) -> List[Skill]:
-        """Returns True as long as this actor can perform actions."""
-        sublist = []
-        for o in self.skills:
-            if o.active_skill:
-                sublist.append(o)
-        return sublist
+        """Returns the skills that can be activated from the skills menu."""
+        self._ensure_index()
+        return self._active_skills
 
     @property
     def is_alive(self) -> bool:
@@ -263,17 +331,7 @@ class Actor(Entity):
         return bool(self.ai)
 
     def melee_neighbors(self):
-        num=0
-        for x2 in [-1,0,1]:
-            for y2 in [-1,0,1]:
-                if x2==0 and y2==0:
-                    pass
-                else:
-                    actor = self.gamemap.get_actor_at_location(self.x+x2,self.y+y2)
-                    if actor:
-                        num=num+1
-
-        return num
+        return self.gamemap.occupied_neighbor_count(self.x, self.y)
 
 
 
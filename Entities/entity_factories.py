@@ -49,6 +49,7 @@ troll = Actor( # real ugly lookin fellow
     fighter=Fighter(hp=16, base_defense=1, base_power=4, will_chance=0.95),
     inventory=Inventory(capacity=0),
     level=Level(xp_given=100),
+    sight_radius=10,
 )
 ice_golem = Actor( # big ice man big ice plan
     char="G",
@@ -59,6 +60,7 @@ ice_golem = Actor( # big ice man big ice plan
     fighter=Fighter(hp=25, base_defense=3, base_power=4, will_chance=1.0),
     inventory=Inventory(capacity=0),
     level=Level(xp_given=120),
+    sight_radius=14,
 )
 
 mawrat = Actor( # it knows...
@@ -70,6 +72,7 @@ mawrat = Actor( # it knows...
     fighter=Fighter(hp=8, base_defense=0, base_power=2, will_chance=1.0),
     inventory=Inventory(capacity=0),
     level=Level(xp_given=50),
+    sight_radius=14,
 )
 mawbeast = Actor( # it knows more...
     char="M",
@@ -92,6 +95,7 @@ ice_sentry_boss = Actor( # monstrous but good in a drink
     inventory=Inventory(capacity=0),
     level=Level(xp_given=1200),
     is_boss=True,
+    sight_radius=16,
 )
 
 ###########################
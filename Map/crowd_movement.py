@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+from actions import MovementAction
+
+if TYPE_CHECKING:
+    from Entities.entity import Actor
+    from Map.game_map import GameMap
+
+
+class MoveRequest:
+    """An actor that wants to step onto `dest`, the next cell of `path`."""
+
+    def __init__(self, entity: Actor, dest: Tuple[int, int], path: List[Tuple[int, int]]):
+        self.entity = entity
+        self.origin = (entity.x, entity.y)
+        self.dest = dest
+        self.path = path
+        # Where the actor is heading after `dest`, fallback steps are judged by it.
+        self.after = path[0] if path else dest
+
+    def candidates(self, game_map: GameMap) -> List[Tuple[int, int]]:
+        """The requested cell, then the next best neighbours: cells next to
+        both the actor and the requested cell that don't take the actor
+        further from where it is heading."""
+        x, y = self.origin
+        dest_x, dest_y = self.dest
+        after_x, after_y = self.after
+
+        def distance(cell: Tuple[int, int]) -> Tuple[int, int]:
+            dx, dy = cell[0] - after_x, cell[1] - after_y
+            return max(abs(dx), abs(dy)), dx * dx + dy * dy
+
+        limit = distance(self.origin)[0]
+        fallbacks = [
+            (x + dx, y + dy)
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            if (dx or dy)
+            and (x + dx, y + dy) != self.dest
+            and max(abs(x + dx - dest_x), abs(y + dy - dest_y)) <= 1
+            and game_map.in_bounds(x + dx, y + dy)
+        ]
+        fallbacks = [cell for cell in fallbacks if distance(cell)[0] <= limit]
+        fallbacks.sort(key=distance)
+        return [self.dest] + fallbacks
+
+
+class CrowdMovement:
+    """
+    The movement phase of the enemy turns.
+
+    While it is active, AIs walking along a path request their step instead
+    of moving straight away. Once every actor has acted the requests are
+    resolved together, so actors stop walking into each other and throwing
+    away their turn on a blocked MovementAction.
+
+    Actors closest to the end of their path go first. A cell is granted to
+    one actor only, and granted moves are made straight away, so the map's
+    blocked grid is the reservation table: a cell an actor moves out of is
+    free for the actor behind it. An actor whose cell is held by another
+    actor that still has to move waits for it, and if the cell stays taken
+    it falls back to its next best neighbour, or waits for next turn.
+    """
+
+    def __init__(self, game_map: GameMap):
+        self.game_map = game_map
+        self.requests: List[MoveRequest] = []
+
+    def request(self, entity: Actor, dest: Tuple[int, int], path: List[Tuple[int, int]]) -> None:
+        """Ask for `entity` to step onto `dest`, having popped it off `path`."""
+        self.requests.append(MoveRequest(entity, dest, path))
+
+    def resolve(self) -> None:
+        """Grant the requested cells and move the actors."""
+        game_map = self.game_map
+        pending = sorted(
+            (request for request in self.requests if request.entity.is_alive and request.entity.gamemap is game_map),
+            key=lambda request: len(request.path),
+        )
+        self.requests = []
+        patient = True
+        while pending:
+            waiting: Dict[Tuple[int, int], MoveRequest] = {request.origin: request for request in pending}
+            deferred = []
+            for request in pending:
+                del waiting[request.origin]
+                entity = request.entity
+                if not entity.is_alive or (entity.x, entity.y) != request.origin:
+                    continue  # Killed or moved by an earlier actor's move.
+                outcome = self._claim(request, waiting if patient else {})
+                if outcome is None:
+                    deferred.append(request)
+                    waiting[request.origin] = request
+                elif not outcome:
+                    # Keep the step, it is tried again next turn.
+                    request.path.insert(0, request.dest)
+            if len(deferred) == len(pending):
+                # Actors waiting on each other in a ring, stop waiting.
+                patient = False
+            pending = deferred
+
+    def _claim(self, request: MoveRequest, waiting: Dict[Tuple[int, int], MoveRequest]):
+        """Move `request`'s actor onto the first free cell it will take.
+
+        Returns True if it moved, False if it can't move this turn, or None
+        if its best free cell is held by an actor in `waiting`.
+        """
+        game_map = self.game_map
+        walkable = game_map.tiles["walkable"]
+        for cell in request.candidates(game_map):
+            if not walkable[cell]:
+                continue
+            if game_map.blocked[cell]:
+                if cell in waiting:
+                    return None
+                continue
+            entity = request.entity
+            MovementAction(entity, cell[0] - entity.x, cell[1] - entity.y).perform()
+            if cell != request.dest and not (
+                    request.path and max(abs(cell[0] - request.after[0]), abs(cell[1] - request.after[1])) <= 1
+            ):
+                # Sidestepped out of reach of the path, step back onto it.
+                request.path.insert(0, request.dest)
+            return True
+        return False
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import lzma
+import pickle
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from Entities.entity import Actor
+from Map.tile_types import encode_tiles
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from Entities.entity import Entity
+    from Map.game_map import GameMap
+
+# Floors kept whole in memory. Older floors are kept as a FloorDelta.
+HOT_FLOORS = 3
+
+
+class FloorBaseline:
+    """
+    How a floor looked straight after it was generated: the generator, the
+    seed, the tiles and the furniture and items it spawned.
+
+    Actors are left out, they change too much to be worth diffing and are
+    stored whole instead. The checksum is what a regeneration from the same
+    seed has to match, so a changed generator is caught instead of replaying
+    changes onto a different map.
+    """
+
+    def __init__(self, game_map: GameMap, generator: str, floor: int, seed: int):
+        self.generator = generator
+        self.floor = floor
+        self.seed = seed
+        self.tiles = encode_tiles(game_map.tiles)
+        player = game_map.engine.player
+        self.spawned: List[Entity] = sorted(
+            (entity for entity in game_map.entities if entity is not player and not isinstance(entity, Actor)),
+            key=lambda entity: (entity.x, entity.y, entity.name, entity.char),
+        )
+        self.cells = [(entity.x, entity.y) for entity in self.spawned]
+
+        digest = hashlib.sha1(f"{generator}:{floor}:{seed}".encode())
+        digest.update(self.tiles.tobytes(order="F"))
+        digest.update(repr([(entity.name, cell) for entity, cell in zip(self.spawned, self.cells)]).encode())
+        self.checksum = digest.hexdigest()[:16]
+
+
+class FloorDelta:
+    """A floor the player left, stored as its seed and what changed since it
+    was generated."""
+
+    def __init__(self, game_map: GameMap):
+        baseline: FloorBaseline = game_map.baseline
+        self.generator = baseline.generator
+        self.floor = baseline.floor
+        self.seed = baseline.seed
+        self.checksum = baseline.checksum
+
+        # Opened doors, cleared hidden walls and anything else that changed a
+        # tile. Tiles that aren't a known tile type are always stored.
+        ids = encode_tiles(game_map.tiles).ravel(order="F")
+        changed = np.flatnonzero((ids != baseline.tiles.ravel(order="F")) | (ids == 255))
+        self.tile_cells = changed.astype(np.int32)
+        self.tile_values = game_map.tiles.ravel(order="F")[changed]
+        self.explored = np.packbits(game_map.explored.ravel(order="F"))
+        self.door_open = game_map.door_open
+
+        # Spawned items and furniture that were picked up, destroyed or moved.
+        self.removed: List[int] = []
+        self.moved: Dict[int, Tuple[int, int]] = {}
+        for index, (entity, cell) in enumerate(zip(baseline.spawned, baseline.cells)):
+            if entity.parent is not game_map or entity not in game_map.entities:
+                self.removed.append(index)
+            elif (entity.x, entity.y) != cell:
+                self.moved[index] = (entity.x, entity.y)
+
+        # Everything else on the floor: actors, corpses and dropped items.
+        spawned = set(baseline.spawned)
+        others = [
+            entity for entity in game_map.entities
+            if entity is not game_map.engine.player and entity not in spawned
+        ]
+        buffer = io.BytesIO()
+        _FloorPickler(buffer, game_map).dump(others)
+        self.entities = lzma.compress(buffer.getvalue())
+        # The boss is stored like any other actor and becomes engine.boss
+        # again when the floor is replayed.
+        boss = game_map.engine.boss
+        self.boss_index = next((index for index, entity in enumerate(others) if entity is boss), None)
+
+    def replay(self, engine: Engine) -> Optional[GameMap]:
+        """Regenerate the floor and apply the changes to it, or return None if
+        the generator no longer makes the same floor from this seed."""
+        game_map = engine.game_world.regenerate_floor(self.floor, self.seed)
+        baseline: FloorBaseline = game_map.baseline
+        if baseline.generator != self.generator or baseline.checksum != self.checksum:
+            return None
+
+        if len(self.tile_cells):
+            x, y = np.unravel_index(self.tile_cells, game_map.tiles.shape, order="F")
+            game_map.tiles[x, y] = self.tile_values
+            game_map.tiles_changed()
+        explored = np.unpackbits(self.explored, count=game_map.explored.size).astype(bool)
+        game_map.explored[...] = explored.reshape(game_map.explored.shape, order="F")
+        game_map.door_open = self.door_open
+
+        for entity in list(game_map.entities):
+            if isinstance(entity, Actor) and entity is not engine.player:
+                game_map.remove_entity(entity)
+        for index in self.removed:
+            game_map.remove_entity(baseline.spawned[index])
+        for index, (x, y) in self.moved.items():
+            baseline.spawned[index].place(x, y)
+
+        others = _FloorUnpickler(io.BytesIO(lzma.decompress(self.entities)), game_map).load()
+        for entity in others:
+            game_map.add_entity(entity)
+        if self.boss_index is not None:
+            engine.boss = others[self.boss_index]
+        return game_map
+
+
+class _FloorPickler(pickle.Pickler):
+    """Pickles the entities of a floor, leaving out the engine, the player,
+    the floor itself and its spawned entities, which are all there again
+    when the floor is regenerated."""
+
+    def __init__(self, file, game_map: GameMap):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.game_map = game_map
+        self.engine = game_map.engine
+        self.spawned = {
+            id(entity): index for index, entity in enumerate(game_map.baseline.spawned)
+            if entity.parent is game_map and entity in game_map.entities
+        }
+
+    def persistent_id(self, obj):
+        if obj is self.engine:
+            return "engine"
+        if obj is self.engine.player:
+            return "player"
+        if obj is self.game_map:
+            return "map"
+        index = self.spawned.get(id(obj))
+        if index is not None:
+            return index
+        return None
+
+
+class _FloorUnpickler(pickle.Unpickler):
+    def __init__(self, file, game_map: GameMap):
+        super().__init__(file)
+        self.game_map = game_map
+        self.engine = game_map.engine
+
+    def persistent_load(self, pid):
+        if pid == "engine":
+            return self.engine
+        if pid == "player":
+            return self.engine.player
+        if pid == "map":
+            return self.game_map
+        if isinstance(pid, int):
+            return self.game_map.baseline.spawned[pid]
+        raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
+
+
+class FloorStore:
+    """
+    Floors the player has left, so they can be revisited.
+
+    The `capacity` most recently left floors stay in memory whole. Older
+    generated floors are kept as a FloorDelta, their seed and what changed,
+    and are regenerated when the player returns. Floors that weren't
+    generated from a seed are kept compressed instead.
+    """
+
+    def __init__(self, engine: Engine, capacity: int = HOT_FLOORS):
+        self.engine = engine
+        self.capacity = capacity
+        self.hot: "OrderedDict[int, GameMap]" = OrderedDict()
+        self.cold: Dict[int, Union[FloorDelta, bytes]] = {}
+
+    def __contains__(self, floor: int) -> bool:
+        return floor in self.hot or floor in self.cold
+
+    def put(self, floor: int, game_map: GameMap) -> None:
+        """Keep `game_map` as floor number `floor`."""
+        self.hot[floor] = game_map
+        self.hot.move_to_end(floor)
+        while len(self.hot) > self.capacity:
+            self._freeze(*self.hot.popitem(last=False))
+
+    def take(self, floor: int) -> Optional[GameMap]:
+        """Remove and return floor `floor`, or None if it was never stored or
+        can't be rebuilt."""
+        game_map = self.hot.pop(floor, None)
+        if game_map is not None:
+            return game_map
+        cold = self.cold.pop(floor, None)
+        if cold is None:
+            return None
+        if isinstance(cold, FloorDelta):
+            return cold.replay(self.engine)
+        return _WholeFloorUnpickler(io.BytesIO(lzma.decompress(cold)), self.engine).load()
+
+    def _freeze(self, floor: int, game_map: GameMap) -> None:
+        if game_map.baseline is not None:
+            self.cold[floor] = FloorDelta(game_map)
+            return
+        buffer = io.BytesIO()
+        _WholeFloorPickler(buffer, self.engine).dump(game_map)
+        self.cold[floor] = lzma.compress(buffer.getvalue())
+
+
+class _WholeFloorPickler(pickle.Pickler):
+    """Pickles a floor on its own, leaving out the engine and the player."""
+
+    def __init__(self, file, engine: Engine):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.engine = engine
+
+    def persistent_id(self, obj):
+        if obj is self.engine:
+            return "engine"
+        if obj is self.engine.player:
+            return "player"
+        return None
+
+
+class _WholeFloorUnpickler(pickle.Unpickler):
+    def __init__(self, file, engine: Engine):
+        super().__init__(file)
+        self.engine = engine
+
+    def persistent_load(self, pid):
+        if pid == "engine":
+            return self.engine
+        if pid == "player":
+            return self.engine.player
+        raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import random
+from typing import Optional, Tuple
+
+import numpy as np  # type: ignore
+
+
+class FreeCellIndex:
+    """
+    The cells of an area that are still free to spawn on, kept as flat
+    coordinate arrays.
+
+    `take` hands out a random free cell and forgets it in O(1) by swapping
+    the last cell into its slot, so filling an area never retries a cell that
+    is already taken.
+    """
+
+    def __init__(self, free: np.ndarray, origin: Tuple[int, int] = (0, 0)):
+        """`free` is a boolean mask of the area whose top left corner is at
+        `origin` on the map."""
+        xs, ys = np.nonzero(free)
+        self.xs = xs + origin[0]
+        self.ys = ys + origin[1]
+        self.count = len(xs)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def take(self) -> Optional[Tuple[int, int]]:
+        """Remove and return a random free cell, or None if there are none left."""
+        if not self.count:
+            return None
+        index = random.randrange(self.count)
+        last = self.count - 1
+        x, y = int(self.xs[index]), int(self.ys[index])
+        self.xs[index], self.ys[index] = self.xs[last], self.ys[last]
+        self.count = last
+        return x, y
+
+    def choice(self, candidates: Optional[np.ndarray] = None) -> Optional[Tuple[int, int]]:
+        """Return a random free cell without taking it. `candidates` is an
+        optional boolean filter over the free cells, in index order."""
+        xs, ys = self.xs[: self.count], self.ys[: self.count]
+        if candidates is not None:
+            xs, ys = xs[candidates], ys[candidates]
+        if not len(xs):
+            return None
+        index = random.randrange(len(xs))
+        return int(xs[index]), int(ys[index])
+
+    def chebyshev_from(self, x: int, y: int) -> np.ndarray:
+        """The Chebyshev distance from (x, y) to each free cell, in index order."""
+        return np.maximum(np.abs(self.xs[: self.count] - x), np.abs(self.ys[: self.count] - y))
@@ -5,21 +5,29 @@ import numpy
 import numpy as np  # type: ignore
 import tcod
 from tcod.console import Console
-import csv
 import colorsys
 import random
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
 
 from Entities import entity_factories
 from Map import tile_types
+from Map.floor_store import FloorBaseline, FloorStore
+from Map.free_cells import FreeCellIndex
+from Map.los_oracle import LineOfSightOracle
+from Map.path_hierarchy import PathHierarchy
+from Map.prefabs import BOSS_PALETTE, SURFACE_PALETTE, load_prefab
+from Map.validation import FloorReport
 from Entities.entity import Actor, Item
+from Entities.render_order import RenderOrder
 from Map.procgen_cave import generate_cave2
 from Map.procgen_dungeon import generate_dungeon, generate_cave, generate_temple, generate_barracks
 
 if TYPE_CHECKING:
     from engine import Engine
     from Entities.entity import Entity
+    from UI.camera import Camera
 
 def scale_lightness(rgb, scale_l):
     # convert rgb to hls
@@ -42,6 +50,10 @@ def scale_lightness_saturation(rgb, scale_l, scale_s):
     return colorsys.hls_to_rgb(h, min(l, l * scale_l), min(s, s * scale_s))
 
 
+# Layers in the order they are drawn, later layers are drawn on top.
+RENDER_LAYERS = sorted(RenderOrder, key=lambda render_order: render_order.value)
+
+
 class GameMap:
     def __init__(
         self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = ()
@@ -49,7 +61,56 @@ class GameMap:
         self.engine = engine
         self.door_open=False
         self.width, self.height = width, height
-        self.entities = set(entities)
+        self.entities: Set[Entity] = set()
+        # Entities bucketed by the layer they are drawn on, plus the glyph
+        # arrays for each layer which are rebuilt only after something in
+        # that layer changes.
+        self.render_layers: Dict[RenderOrder, Set[Entity]] = {
+            render_order: set() for render_order in RENDER_LAYERS
+        }
+        self.light_emitters: Set[Entity] = set()
+        # Spatial indexes: the entities on each cell, the living actors and a
+        # grid counting them per cell. _entity_state remembers where and how
+        # each entity was indexed so it can be taken out again after it changed.
+        self.living_actors: Set[Actor] = set()
+        self.actor_count = np.zeros((width, height), dtype=np.int16, order="F")
+        self.entity_count = np.zeros((width, height), dtype=np.int16, order="F")
+        # Cells holding at least one entity that blocks movement, and how many.
+        self.blocked = np.zeros((width, height), dtype=bool, order="F")
+        self._blocking_count = np.zeros((width, height), dtype=np.int16, order="F")
+        self._entities_at: Dict[Tuple[int, int], List[Entity]] = {}
+        self._entity_state: Dict[Entity, tuple] = {}
+        self._layer_glyphs: Dict[RenderOrder, Tuple[np.ndarray, ...]] = {}
+        # Entities inside the player's FOV mapped to their distance from the
+        # player. Built after each FOV update and kept current as entities
+        # move, see visible_entities.
+        self._visible_entities: Optional[Dict[Entity, float]] = None
+        self._visible_actors: Optional[List[Actor]] = None
+
+        # Bumped by tiles_changed whenever walkable or transparent tiles
+        # change after generation, anything derived from the tiles is keyed
+        # on it.
+        self.transparency_version = 0
+        # Recent FOV results keyed by (viewpoint, radius, transparency_version),
+        # each stored as [visible, merged into explored], see Engine.update_fov.
+        self.fov_cache: "OrderedDict[tuple, list]" = OrderedDict()
+        self.fov_key: Optional[tuple] = None  # Key of the FOV in `visible`.
+        # Optional precomputed line of sight, see build_los_oracle. Not saved,
+        # it is rebuilt on the first query after loading.
+        self.los_oracle_enabled = False
+        self.los_oracle: Optional[LineOfSightOracle] = None
+        # Line of sight from the player at any range, for when there is no
+        # oracle or it isn't built yet, see line_of_sight.
+        self._line_of_sight: Optional[np.ndarray] = None
+        self._line_of_sight_key: Optional[tuple] = None
+        # Portal graph for pathfinding on large maps, built on first use and
+        # not saved, see path_hierarchy.
+        self._path_hierarchy: Optional[PathHierarchy] = None
+
+        # Noises made this turn as (x, y, loudness), merged into noise_field
+        # by propagate_noise at the start of the next enemy turn.
+        self.noise_sources: List[Tuple[int, int, int]] = []
+        self.noise_field: Optional[np.ndarray] = None
         self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
         self.visible = np.full(
             (width, height), fill_value=False, order="F"
@@ -62,8 +123,292 @@ class GameMap:
             (self.width, self.height), fill_value=False, order="F"
         )
         self.downstairs_location = (0, 0)
+        self.upstairs_location: Optional[Tuple[int, int]] = None
+        self.generation_report: Optional[FloorReport] = None  # Set by procedural generators.
+        self.baseline: Optional[FloorBaseline] = None  # Set for floors generated from a seed.
         self.num = 0
 
+        for entity in entities:
+            self.add_entity(entity)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_layer_glyphs"] = {}
+        state["_visible_entities"] = None
+        state["_visible_actors"] = None
+        state["fov_cache"] = OrderedDict()
+        state["fov_key"] = None
+        state["los_oracle"] = None
+        state["_line_of_sight"] = None
+        state["_line_of_sight_key"] = None
+        state["noise_field"] = None
+        state["_path_hierarchy"] = None
+        return state
+
+    def tiles_changed(self) -> None:
+        """Call after changing tiles on a live map, e.g. opening doors."""
+        self.transparency_version += 1
+        self.fov_cache.clear()
+        self.fov_key = None
+        if self.los_oracle_enabled:
+            self.build_los_oracle()
+
+    def build_los_oracle(self) -> None:
+        """Start precomputing line of sight for the current tiles in the background."""
+        if self.los_oracle is not None:
+            self.los_oracle.cancel()
+        self.los_oracle_enabled = True
+        self.los_oracle = LineOfSightOracle(self.tiles["transparent"])
+        self.los_oracle.start()
+
+    def can_see(self, a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+        """Return True if there is a line of sight from `a` to `b`.
+
+        Answered by the oracle once it is built, otherwise by walking the line.
+        """
+        if self.los_oracle is None and self.los_oracle_enabled:
+            self.build_los_oracle()
+        if self.los_oracle is not None:
+            seen = self.los_oracle.can_see(a, b)
+            if seen is not None:
+                return seen
+        line = tcod.los.bresenham(a, b)[1:-1]
+        return bool(self.tiles["transparent"][line[:, 0], line[:, 1]].all())
+
+    def line_of_sight(self, x: int, y: int) -> np.ndarray:
+        """Cells in line of sight from (x, y) at any range.
+
+        The same cells the oracle would report, computed on the spot and
+        kept until (x, y) or the tiles change.
+        """
+        key = (x, y, self.transparency_version)
+        if key != self._line_of_sight_key:
+            self._line_of_sight = tcod.map.compute_fov(self.tiles["transparent"], (x, y), radius=0)
+            self._line_of_sight_key = key
+        return self._line_of_sight
+
+    def replace_tiles(self, old: np.ndarray, new: np.ndarray) -> None:
+        """Turn every `old` tile inside the map border into `new`."""
+        inner = self.tiles[1:-1, 1:-1]
+        inner[inner == old] = new
+        self.tiles_changed()
+
+    def add_entity(self, entity: Entity) -> None:
+        """Add `entity` to this map and to its indexes."""
+        self.entities.add(entity)
+        if entity in self._entity_state:
+            self._unindex_entity(entity)  # Already here, e.g. the player passed to __init__.
+        self._index_entity(entity)
+        self._update_visibility(entity)
+
+    def remove_entity(self, entity: Entity) -> None:
+        """Remove `entity` from this map and its indexes."""
+        self.entities.remove(entity)
+        self._unindex_entity(entity)
+        if self._visible_entities is not None and self._visible_entities.pop(entity, None) is not None:
+            self._visible_actors = None
+
+    def update_entity(self, entity: Entity) -> None:
+        """Refresh the indexes after `entity` moved or changed how it is drawn."""
+        if entity not in self._entity_state:
+            return  # Not on this map.
+        self._unindex_entity(entity)
+        self._index_entity(entity)
+        self._update_visibility(entity)
+
+    def _index_entity(self, entity: Entity) -> None:
+        location = (entity.x, entity.y)
+        living_actor = isinstance(entity, Actor) and entity.is_alive
+        blocks = entity.blocks_movement
+        if not self.in_bounds(*location):
+            location = None  # Still at its spot on the last map, it is about to be placed.
+        self._entity_state[entity] = (location, entity.render_order, living_actor, blocks)
+        self.render_layers[entity.render_order].add(entity)
+        self._layer_glyphs.pop(entity.render_order, None)
+        if living_actor:
+            self.living_actors.add(entity)
+        if location is not None:
+            self._entities_at.setdefault(location, []).append(entity)
+            self.entity_count[location] += 1
+            if living_actor:
+                self.actor_count[location] += 1
+            if blocks:
+                self._blocking_count[location] += 1
+                self.blocked[location] = True
+        if entity.emits_light:
+            self.light_emitters.add(entity)
+
+    def _unindex_entity(self, entity: Entity) -> None:
+        location, render_order, living_actor, blocks = self._entity_state.pop(entity)
+        self.render_layers[render_order].discard(entity)
+        self._layer_glyphs.pop(render_order, None)
+        if living_actor:
+            self.living_actors.discard(entity)
+        if location is not None:
+            entities_here = self._entities_at[location]
+            entities_here.remove(entity)
+            if not entities_here:
+                del self._entities_at[location]
+            self.entity_count[location] -= 1
+            if living_actor:
+                self.actor_count[location] -= 1
+            if blocks:
+                self._blocking_count[location] -= 1
+                self.blocked[location] = self._blocking_count[location] > 0
+        self.light_emitters.discard(entity)
+
+    def _update_visibility(self, entity: Entity) -> None:
+        """Bring the visible entity cache up to date for a single entity."""
+        visible_entities = self._visible_entities
+        if visible_entities is None:
+            return
+        player = self.engine.player
+        if entity is player:
+            # Every distance is measured from the player.
+            self.visibility_changed()
+            return
+        if self.visible[entity.x, entity.y]:
+            visible_entities[entity] = entity.distance(player.x, player.y)
+        elif visible_entities.pop(entity, None) is None:
+            return
+        if isinstance(entity, Actor):
+            self._visible_actors = None
+
+    def visibility_changed(self) -> None:
+        """Drop the visible entity cache, call this whenever `visible` changes."""
+        self._visible_entities = None
+        self._visible_actors = None
+
+    def update_visible_entities(self) -> None:
+        """Rebuild the visible entity cache after a new FOV was computed."""
+        self.visibility_changed()
+        self.visible_actors
+
+    @property
+    def visible_entities(self) -> Dict[Entity, float]:
+        """Entities the player can see, mapped to their distance from the player."""
+        if self._visible_entities is None:
+            player = self.engine.player
+            visible = self.visible
+            self._visible_entities = {
+                entity: entity.distance(player.x, player.y)
+                for entity in self.entities
+                if visible[entity.x, entity.y]
+            }
+        return self._visible_entities
+
+    @property
+    def visible_actors(self) -> List[Actor]:
+        """Living actors the player can see, nearest first."""
+        if self._visible_actors is None:
+            visible_entities = self.visible_entities
+            self._visible_actors = sorted(
+                (
+                    entity
+                    for entity in visible_entities
+                    if isinstance(entity, Actor) and entity.is_alive
+                ),
+                key=visible_entities.__getitem__,
+            )
+        return self._visible_actors
+
+    def update_perception(self) -> None:
+        """Work out in one pass how far each monster is from the player and
+        whether it can see them, storing the result on the actors.
+
+        Line of sight comes from the oracle when it is ready, otherwise it is
+        computed from the player on the spot. Both see to any range, so
+        whether a monster notices the player doesn't depend on the oracle's
+        background thread, or on the player's shorter FOV radius.
+        """
+        player = self.engine.player
+        actors = [actor for actor in self.actors if actor is not player]
+        if not actors:
+            return
+        count = len(actors)
+        xs = np.fromiter((actor.x for actor in actors), dtype=np.intp, count=count)
+        ys = np.fromiter((actor.y for actor in actors), dtype=np.intp, count=count)
+        radii = np.fromiter((actor.sight_radius for actor in actors), dtype=np.intp, count=count)
+
+        distance = np.maximum(np.abs(xs - player.x), np.abs(ys - player.y))  # Chebyshev distance.
+        los = None
+        if self.los_oracle is not None:
+            los = self.los_oracle.seen_from((player.x, player.y), xs, ys)
+        if los is None:
+            los = self.line_of_sight(player.x, player.y)[xs, ys]
+        sees = los & (distance < radii)
+
+        for actor, actor_distance, actor_sees in zip(actors, distance.tolist(), sees.tolist()):
+            actor.player_distance = actor_distance
+            actor.sees_player = actor_sees
+
+    def emit_noise(self, x: int, y: int, loudness: int) -> None:
+        """Make a noise at (x, y) that can be heard up to `loudness` steps away."""
+        self.noise_sources.append((x, y, loudness))
+
+    def propagate_noise(self) -> None:
+        """Spread this turn's noises over the walkable tiles in a single sweep.
+
+        Every source is a root of one Dijkstra map, started at minus its
+        loudness, so a negative value in `noise_field` is how loud the nearest
+        noise still is at that tile. Walls and closed doors block sound.
+        """
+        if not self.noise_sources:
+            self.noise_field = None
+            return
+        field = np.full((self.width, self.height), np.iinfo(np.int32).max, dtype=np.int32, order="F")
+        for x, y, loudness in self.noise_sources:
+            field[x, y] = min(field[x, y], -loudness)
+        self.noise_sources = []
+        cost = np.array(self.tiles["walkable"], dtype=np.int8)
+        tcod.path.dijkstra2d(field, cost, 1, 1)
+        self.noise_field = field
+
+    def noise_at(self, x: int, y: int) -> int:
+        """How loud the noise heard at (x, y) this turn is, 0 for silence."""
+        if self.noise_field is None:
+            return 0
+        return max(0, -int(self.noise_field[x, y]))
+
+    def path_to_noise(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """Return the path from (x, y) towards the loudest noise heard there."""
+        if not self.noise_at(x, y):
+            return []
+        path = tcod.path.hillclimb2d(self.noise_field, (x, y), True, True)[1:].tolist()
+        return [(index[0], index[1]) for index in path]
+
+    def path_to_unexplored(self, x: int, y: int) -> List[Tuple[int, int]]:
+        """Return the path from (x, y) to the nearest walkable tile that
+        hasn't been explored, or an empty list if none can be reached."""
+        passable = self.passable
+        field = np.full((self.width, self.height), np.iinfo(np.int32).max, dtype=np.int32, order="F")
+        field[passable & ~self.explored] = 0
+        cost = np.array(passable, dtype=np.int8)
+        cost[x, y] = 1
+        tcod.path.dijkstra2d(field, cost, 2, 3)
+        if field[x, y] == np.iinfo(np.int32).max:
+            return []
+        path = tcod.path.hillclimb2d(field, (x, y), True, True)[1:].tolist()
+        return [(index[0], index[1]) for index in path]
+
+    def is_entity_visible(self, entity: Entity) -> bool:
+        """Return True if the player can currently see `entity`."""
+        return entity in self.visible_entities
+
+    def layer_glyphs(self, render_order: RenderOrder) -> Tuple[np.ndarray, ...]:
+        """Return (x, y, ch, fg) arrays for the entities drawn on one layer."""
+        glyphs = self._layer_glyphs.get(render_order)
+        if glyphs is None:
+            layer = [entity for entity in self.render_layers[render_order] if entity.char]
+            glyphs = (
+                np.fromiter((entity.x for entity in layer), dtype=np.intp, count=len(layer)),
+                np.fromiter((entity.y for entity in layer), dtype=np.intp, count=len(layer)),
+                np.fromiter((ord(entity.char[0]) for entity in layer), dtype=np.int32, count=len(layer)),
+                np.array([entity.color for entity in layer], dtype=np.uint8).reshape(-1, 3),
+            )
+            self._layer_glyphs[render_order] = glyphs
+        return glyphs
+
     @property
     def gamemap(self) -> GameMap:
         return self
@@ -71,60 +416,140 @@ class GameMap:
     @property
     def actors(self) -> Iterator[Actor]:
         """Iterate over this maps living actors."""
-        yield from (
-            entity
-            for entity in self.entities
-            if isinstance(entity, Actor) and entity.is_alive
-        )
+        # Iterate over a copy, actors may die or leave while this is consumed.
+        yield from tuple(self.living_actors)
 
 
     @property
     def items(self) -> Iterator[Item]:
         yield from (entity for entity in self.entities if isinstance(entity, Item))
 
+    @property
+    def passable(self) -> np.ndarray:
+        """Cells that can be walked onto right now: walkable and not blocked."""
+        return self.tiles["walkable"] & ~self.blocked
+
+    def is_blocked(self, x: int, y: int) -> bool:
+        """True if an entity blocking movement stands at (x, y)."""
+        return bool(self.blocked[x, y])
+
+    def free_cells(
+        self, area: Tuple[slice, slice] = (slice(None), slice(None)), blocking_only: bool = False,
+    ) -> FreeCellIndex:
+        """Return an index of the walkable cells in `area` with nothing on them.
+        With `blocking_only`, cells holding only entities that can be walked
+        over count as free too."""
+        if blocking_only:
+            free = self.tiles["walkable"][area] & ~self.blocked[area]
+        else:
+            free = self.tiles["walkable"][area] & (self.entity_count[area] == 0)
+        return FreeCellIndex(free, (area[0].start or 0, area[1].start or 0))
+
     def get_blocking_entity_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        for entity in self.entities:
-            if entity.blocks_movement and entity.x == location_x and entity.y == location_y:
+        if not self.in_bounds(location_x, location_y) or not self.blocked[location_x, location_y]:
+            return None
+        for entity in self._entities_at.get((location_x, location_y), ()):
+            if entity.blocks_movement:
                 return entity
 
         return None
 
     def get_entity_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        for entity in self.entities:
-            if entity.x == location_x and entity.y == location_y:
-                return entity
+        entities = self._entities_at.get((location_x, location_y))
+        if entities:
+            return entities[0]
 
         return None
 
     def get_entities_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        entities=[]
-        for entity in self.entities:
-            if entity.x == location_x and entity.y == location_y:
-                entities.append(entity)
-
-        return entities
+        return list(self._entities_at.get((location_x, location_y), ()))
 
     def remove_entities_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        for entity in self.entities.copy():
-            if entity.x == location_x and entity.y == location_y:
-                self.entities.remove(entity)
+        for entity in self.get_entities_at_location(location_x, location_y):
+            self.remove_entity(entity)
 
         return None
 
     def get_actor_at_location(self, x: int, y: int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
+        if not self.in_bounds(x, y) or not self.actor_count[x, y]:
+            return None
+        for entity in self._entities_at[x, y]:
+            if entity in self.living_actors:
+                return entity
+
+        return None
+
+    def _actors_on_cells(self, xs: np.ndarray, ys: np.ndarray) -> Iterator[Actor]:
+        """Yield the living actors on each of the given cells, in order."""
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            for entity in self._entities_at[x, y]:
+                if entity in self.living_actors:
+                    yield entity
+
+    def _actor_cells_near(self, x: int, y: int, radius: float, visible_only: bool = False):
+        """Return the cells within the box around (x, y) which hold a living
+        actor, and their squared distances from (x, y)."""
+        reach = int(np.ceil(radius))
+        x0, x1 = max(x - reach, 0), min(x + reach + 1, self.width)
+        y0, y1 = max(y - reach, 0), min(y + reach + 1, self.height)
+        occupied = self.actor_count[x0:x1, y0:y1] > 0
+        if visible_only:
+            occupied &= self.visible[x0:x1, y0:y1]
+        xs, ys = np.nonzero(occupied)
+        xs += x0
+        ys += y0
+        return xs, ys, (xs - x) ** 2 + (ys - y) ** 2
+
+    def actors_within_radius(self, x: int, y: int, radius: float) -> List[Actor]:
+        """Return the living actors no further than `radius` from (x, y)."""
+        xs, ys, distance2 = self._actor_cells_near(x, y, radius)
+        inside = distance2 <= radius * radius
+        return list(self._actors_on_cells(xs[inside], ys[inside]))
+
+    def nearest_actor(
+        self,
+        x: int,
+        y: int,
+        max_distance: float,
+        predicate: Optional[Callable[[Actor], bool]] = None,
+        visible_only: bool = True,
+    ) -> Optional[Actor]:
+        """Return the closest living actor less than `max_distance` from (x, y)
+        for which `predicate` is true. By default only actors the player can
+        see are considered."""
+        xs, ys, distance2 = self._actor_cells_near(x, y, max_distance, visible_only)
+        inside = distance2 < max_distance * max_distance
+        xs, ys, distance2 = xs[inside], ys[inside], distance2[inside]
+        order = np.argsort(distance2, kind="stable")
+        for actor in self._actors_on_cells(xs[order], ys[order]):
+            if predicate is None or predicate(actor):
                 return actor
 
         return None
 
+    def occupied_neighbor_count(self, x: int, y: int) -> int:
+        """Return how many of the 8 cells around (x, y) hold a living actor."""
+        x0, x1 = max(x - 1, 0), min(x + 2, self.width)
+        y0, y1 = max(y - 1, 0), min(y + 2, self.height)
+        return int(np.count_nonzero(self.actor_count[x0:x1, y0:y1])) - bool(self.actor_count[x, y])
+
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x and y are inside of the bounds of this map."""
         return 0 <= x < self.width and 0 <= y < self.height
 
-    def render(self, console: Console, playerx, playery) -> None:
+    @property
+    def path_hierarchy(self) -> PathHierarchy:
+        if self._path_hierarchy is None:
+            self._path_hierarchy = PathHierarchy(self)
+        return self._path_hierarchy
+
+    def stream_around(self, entity: Entity) -> None:
+        """Called after the player moves. Maps that only hold part of their
+        floor, see OverworldMap, load the part around `entity` here."""
+
+    def render(self, console: Console, camera: Camera) -> None:
         """
-                Renders the map.
+                Renders the part of the map in view of the camera.
 
                 If a tile is in the "visible" array, then draw it with the "light" colors.
                 If it isn't, but it's in the "explored" array, then draw it with the "dark" colors.
@@ -134,36 +559,38 @@ class GameMap:
                 However the seed for lighting flicker only gets reset when the bottom-right most visible
                 tile's location changes (i.e the player moves)
                 """
+        view = camera.slices
+        visible = self.visible[view]
         tilestorender = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
+            condlist=[visible, self.explored[view]],
+            choicelist=[self.tiles["light"][view], self.tiles["dark"][view]],
             default=tile_types.SHROUD
         )
-        cost = numpy.ones((self.width, self.height), dtype=numpy.int8)
-        dist = numpy.zeros((self.width, self.height), dtype=numpy.int8)
-        entities_sorted_for_rendering = sorted(
-            self.entities, key=lambda x: x.render_order.value
-        )
+
+        # Light is baked over the view plus the furthest any light source
+        # reaches, so lights just off screen still light the edge of it.
+        reach = max((entity.light_level for entity in self.light_emitters), default=0) // 2 + 2
+        x1, x2 = max(0, view[0].start - reach), min(self.width, view[0].stop + reach)
+        y1, y2 = max(0, view[1].start - reach), min(self.height, view[1].stop + reach)
+        cost = np.where(self.tiles["transparent"][x1:x2, y1:y2], 1, 2).astype(numpy.int8)
+        dist = numpy.zeros((x2 - x1, y2 - y1), dtype=numpy.int8)
 
         """To add more light sources we can add more of the below line. For now its just the player. 
             We add a random offset to simulate flickering light"""
-        for entity in entities_sorted_for_rendering:
-            if entity.emits_light:
-                dist[entity.x, entity.y] = -entity.light_level + random.uniform(-1.5, 1.5)
-
-        for x in range(self.width):
-            for y in range(self.height):
-                cost[x, y] = 1 if self.tiles["transparent"][x][y] else 2
+        for entity in self.light_emitters:
+            if x1 <= entity.x < x2 and y1 <= entity.y < y2:
+                dist[entity.x - x1, entity.y - y1] = -entity.light_level + random.uniform(-1.5, 1.5)
 
         """ Lighting baking """
         tcod.path.dijkstra2d(dist, cost, 2, diagonal=3)
+        dist = dist[view[0].start - x1:view[0].stop - x1, view[1].start - y1:view[1].stop - y1]
         ## max_dist is like the intensity of the flame held by the character. Lower is brighter
         max_dist = 8
         lum = 0.5
         for j in range(tilestorender.shape[1]):
             for i in range(tilestorender.shape[0]):
                 tile = tilestorender[i, j];
-                if self.visible[i, j]:
+                if visible[i, j]:
                     """ For visible tiles we calculate the lighting """
                     fg_t = tile[1]
                     bg_t = tile[2]
@@ -174,7 +601,7 @@ class GameMap:
                     if distn > max_dist:
                         distn = max_dist
                     h, l, s = colorsys.rgb_to_hls(fg_t[0] / 255, fg_t[1] / 255, fg_t[2] / 255)
-                    random.seed(i + j)
+                    random.seed(camera.x + i + camera.y + j)
                     r, g, b = colorsys.hls_to_rgb(h, max(min(1, l - 1 * lum + (distn / -max_dist) * lum), 0), s)
                     if (distn > max_dist):
                         print("oh")
@@ -187,15 +614,17 @@ class GameMap:
                     tile[2][0] = min(255,tile[2][0]*((distn / -16.0) * 0.4)*255.0)/8+tile[2][0]*7/8
                     tile[2][1] = min(255,tile[2][1]*((distn / -16.0) * 0.4)*255.0)/16+tile[2][1]*15/16
 
-        console.tiles_rgb[0:self.width, 0:self.height] = tilestorender
+        console.tiles_rgb[0:camera.view_width, 0:camera.view_height] = tilestorender
 
 
-        for entity in entities_sorted_for_rendering:
-            # Only print entities that are in the FOV
-            if self.visible[entity.x, entity.y]:
-                console.print(
-                    x=entity.x, y=entity.y, string=entity.char, fg=entity.color
-                )
+        tiles_rgb = console.tiles_rgb
+        for render_order in RENDER_LAYERS:
+            xs, ys, ch, fg = self.layer_glyphs(render_order)
+            # Only draw entities that are in view and in the FOV
+            shown = (xs >= camera.x) & (xs < view[0].stop) & (ys >= camera.y) & (ys < view[1].stop)
+            shown[shown] = self.visible[xs[shown], ys[shown]]
+            tiles_rgb["ch"][xs[shown] - camera.x, ys[shown] - camera.y] = ch[shown]
+            tiles_rgb["fg"][xs[shown] - camera.x, ys[shown] - camera.y] = fg[shown]
 
     def flood_reveal(self, x, y,first=False):
 
@@ -213,8 +642,14 @@ class GameMap:
                     if neighboringfloor>0:
                         self.visible[i, j] = True
                         self.explored[i, j] = True
+        self.fov_key = None
+        self.visibility_changed()
+
 
 
+# How many times a procedural floor is regenerated when it can't be repaired.
+MAX_FLOOR_ATTEMPTS = 3
+
 
 class GameWorld:
     """
@@ -243,18 +678,102 @@ class GameWorld:
 
         self.current_floor = current_floor
         self.current_floor_type="dungeon"
+        self.floors = FloorStore(engine)
+        self.floor_types: Dict[int, str] = {}
+        # Totals of the reports of every procedurally generated floor.
+        self.generation_metrics: Dict[str, int] = {
+            "floors": 0, "repaired": 0, "regenerated": 0, "failed": 0, "rejected": 0,
+        }
+
+    def change_floor(self, floor: int) -> None:
+        """Leave the current floor for `floor`, revisiting it if it was
+        stored or generating it otherwise."""
+        going_down = floor > self.current_floor
+        self.floor_types[self.current_floor] = self.current_floor_type
+        self.floors.put(self.current_floor, self.engine.game_map)
+
+        game_map = self.floors.take(floor)
+        if game_map is None:
+            self.current_floor = floor - 1
+            self.generate_floor()
+            return
+
+        self.current_floor = floor
+        self.current_floor_type = self.floor_types.get(floor, self.current_floor_type)
+        self.engine.game_map = game_map
+        if going_down:
+            self.engine.player.place(*game_map.upstairs_location, game_map)
+        else:
+            self.engine.player.place(*game_map.downstairs_location, game_map)
+        if game_map.los_oracle is None:
+            game_map.build_los_oracle()
+
+    def descend(self) -> None:
+        self.change_floor(self.current_floor + 1)
+
+    def ascend(self) -> None:
+        self.change_floor(self.current_floor - 1)
+
+    def place_up_stairs(self) -> None:
+        """Put the stairs back up where the player arrived on a new floor."""
+        game_map = self.engine.game_map
+        location = (self.engine.player.x, self.engine.player.y)
+        game_map.tiles[location] = tile_types.up_stairs
+        game_map.upstairs_location = location
 
     def generate_floor(self) -> None:
 
         self.current_floor += 1
         random.seed()
+        self.build_floor(self.current_floor, random.getrandbits(32))
+        self.engine.player.fighter.energy=self.engine.player.fighter.max_energy
+        self.engine.game_map.build_los_oracle()
+
+    def build_floor(self, floor: int, seed: int) -> GameMap:
+        """
+        Generate floor number `floor` from `seed` and make it the current map.
+
+        The same floor and seed always give the same map, so the floor store
+        can keep a floor the player left as its seed and a list of changes.
+        """
+        self.current_floor = floor
+        random.seed(seed)
+        np.random.seed(seed)
         n=random.random()
-        if self.current_floor==10:
-            print("why",self.current_floor)
+        if floor==10:
             self.load_floor("boss1.csv")
-            self.engine.player.fighter.energy=self.engine.player.fighter.max_energy
-            return
-
+        else:
+            for attempt in range(MAX_FLOOR_ATTEMPTS):
+                if attempt:
+                    self.generation_metrics["regenerated"] += 1
+                self.generate_floor_of_type(n)
+                report = self.engine.game_map.generation_report
+                self.record_generation(report)
+                if report is None or report.ok:
+                    break
+            else:
+                self.generation_metrics["failed"] += 1
+
+        self.place_up_stairs()
+        game_map = self.engine.game_map
+        game_map.baseline = FloorBaseline(game_map, self.current_floor_type, floor, seed)
+        # Don't let the rest of the game play out the same from every seed.
+        random.seed()
+        np.random.seed()
+        return game_map
+
+    def regenerate_floor(self, floor: int, seed: int) -> GameMap:
+        """build_floor for a floor that was generated before, so it isn't
+        counted again and doesn't replace the boss."""
+        metrics = dict(self.generation_metrics)
+        boss = self.engine.boss
+        game_map = self.build_floor(floor, seed)
+        self.generation_metrics = metrics
+        self.engine.boss = boss
+        return game_map
+
+    def generate_floor_of_type(self, n: float) -> None:
+        """Generate a procedural floor, `n` picks the generator."""
         if n<0.5:
             self.engine.game_map = generate_cave2(
                 map_width=self.map_width,
@@ -293,7 +812,14 @@ class GameWorld:
             )
             self.current_floor_type="dungeon"
 
-        self.engine.player.fighter.energy=self.engine.player.fighter.max_energy
+    def record_generation(self, report: Optional[FloorReport]) -> None:
+        if report is None:
+            return
+        metrics = self.generation_metrics
+        metrics["floors"] += 1
+        metrics["rejected"] += report.rejected
+        if report.repaired_pockets:
+            metrics["repaired"] += 1
 
     def load_floor(self,filename:str) -> None:
         player = self.engine.player
@@ -301,54 +827,9 @@ class GameWorld:
 
         self.current_floor_type="special2"
 
-        with open(filename, newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            y=0
-            x=0
-            for row in spamreader:
-                for tile in row:
-                    if tile=="+":
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="s":
-                        entity_factories.statue.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="f":
-                        entity_factories.torch.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="v":
-                        entity_factories.candles.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="c":
-                        entity_factories.chair.spawn(dungeon, x, y)
-                        boss=entity_factories.ice_sentry_boss.spawn(dungeon, x, y)
-                        self.engine.boss=boss
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="t":
-                        entity_factories.stone_plate.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    elif tile=="#":
-                        dungeon.tiles[x, y] = tile_types.wall
-                    elif tile=="0":
-                        dungeon.tiles[x, y] = tile_types.pillar
-                    elif tile=="2":
-                        entity_factories.hidden_door_shut_trigger.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    elif tile=="3":
-                        dungeon.tiles[x, y] = tile_types.floor_hidden_wall
-                    elif tile=="d":
-                        dungeon.tiles[x, y] = tile_types.door
-                    elif tile==">":
-                        dungeon.tiles[x, y] = tile_types.down_stairs
-                        dungeon.downstairs_location = (x,y)
-                    elif tile=="l":
-                        entity_factories.ice_shard.spawn(dungeon, x, y)
-                        dungeon.tiles[x, y] = tile_types.floor
-                    elif tile=="p":
-                        dungeon.tiles[x, y] = tile_types.floor
-                        player.place(*(x,y), dungeon)
-                    x=x+1
-                x=0
-                y=y+1
+        spawned = load_prefab(filename, BOSS_PALETTE).stamp(dungeon)
+        for boss in spawned.get(entity_factories.ice_sentry_boss, ()):
+            self.engine.boss=boss
 
         self.engine.game_map = dungeon
     def load_surface(self,filename:str) -> None:
@@ -357,43 +838,20 @@ class GameWorld:
 
         self.current_floor_type="special1"
 
-        with open(filename, newline='') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            y=0
-            x=0
-            for row in spamreader:
-                for tile in row:
-                    if tile==".":
-                        num=random.randrange(0,3)
-                        if num==0:
-                            dungeon.tiles[x, y] = tile_types.snow
-                        elif num==1:
-                            dungeon.tiles[x, y] = tile_types.snow2
-                        else:
-                            dungeon.tiles[x, y] = tile_types.snow3
-                    if tile=="+":
-                        dungeon.tiles[x, y] = tile_types.floor
-                    if tile=="s":
-                        dungeon.tiles[x, y] = tile_types.floor#spawn statue
-                        entity_factories.statue.spawn(dungeon, x, y)
-                    if tile=="c":
-                        dungeon.tiles[x, y] = tile_types.snow#spawn snowdrift
-                        entity_factories.snowdrift.spawn(dungeon, x, y)
-                    if tile=="t":
-                        dungeon.tiles[x, y] = tile_types.snow#spawn tree
-                        entity_factories.tree.spawn(dungeon, x, y)
-                    elif tile=="#":
-                        dungeon.tiles[x, y] = tile_types.wall
-                    elif tile=="0":
-                        dungeon.tiles[x, y] = tile_types.pillar
-                    elif tile==">":
-                        dungeon.tiles[x, y] = tile_types.down_stairs
-                        dungeon.downstairs_location = (x,y)
-                    elif tile=="p":
-                        dungeon.tiles[x, y] = tile_types.snow
-                        player.place(*(x,y), dungeon)
-                    x=x+1
-                x=0
-                y=y+1
+        load_prefab(filename, SURFACE_PALETTE).stamp(dungeon)
+
+        self.engine.game_map = dungeon
+        dungeon.build_los_oracle()
+
+    def load_overworld(self, filename: str) -> None:
+        """Load the surface as the start area of an overworld that is
+        generated around it as the player explores."""
+        from Map.overworld import OverworldMap, WORLD_CHUNKS
+
+        self.current_floor_type="special1"
+
+        prefab = load_prefab(filename, SURFACE_PALETTE)
+        dungeon = OverworldMap(self.engine, prefab, (WORLD_CHUNKS[0] // 2 - 1, 0), random.getrandbits(32))
 
         self.engine.game_map = dungeon
+        dungeon.build_los_oracle()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+import tcod
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from Entities.entity import Actor
+
+UNREACHABLE = np.iinfo(np.int32).max
+# How strongly the safety map prefers running away over staying close to
+# the threat, as a fraction. Above 1 makes fleeing actors avoid dead ends.
+FLEE_SCALE = (6, 5)
+
+
+class InfluenceMaps:
+    """
+    Tactical maps shared by every AI on the current floor.
+
+    Each map is computed the first time it is asked for in a turn and reused
+    by every other actor that turn, so reading one is O(1) per actor. Lower
+    values are better, actors walk downhill with `downhill_step`.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._maps: Dict[tuple, np.ndarray] = {}
+        self._turn = -1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        state["_turn"] = -1
+        return state
+
+    def _cached(self, key: tuple) -> Optional[np.ndarray]:
+        game_map = self.engine.game_map
+        if self._turn != self.engine.turn:
+            self._maps.clear()
+            self._turn = self.engine.turn
+        return self._maps.get((id(game_map), game_map.transparency_version) + key)
+
+    def _store(self, key: tuple, field: np.ndarray) -> np.ndarray:
+        game_map = self.engine.game_map
+        self._maps[(id(game_map), game_map.transparency_version) + key] = field
+        return field
+
+    def _cost(self) -> np.ndarray:
+        return np.array(self.engine.game_map.tiles["walkable"], dtype=np.int8)
+
+    def distance_from(self, x: int, y: int) -> np.ndarray:
+        """Walking distance in steps from (x, y) to every tile."""
+        key = ("distance", x, y)
+        field = self._cached(key)
+        if field is None:
+            game_map = self.engine.game_map
+            field = np.full((game_map.width, game_map.height), UNREACHABLE, dtype=np.int32, order="F")
+            field[x, y] = 0
+            tcod.path.dijkstra2d(field, self._cost(), 1, 1)
+            field = self._store(key, field)
+        return field
+
+    def safety(self, threat: Actor) -> np.ndarray:
+        """Lower is safer from `threat`.
+
+        The distance map from the threat is inverted and scaled, then relaxed
+        again, so walking downhill leads away along open routes rather than
+        into the nearest corner.
+        """
+        key = ("safety", threat.x, threat.y)
+        field = self._cached(key)
+        if field is None:
+            distance = self.distance_from(threat.x, threat.y)
+            reached = distance != UNREACHABLE
+            field = np.full(distance.shape, UNREACHABLE, dtype=np.int32, order="F")
+            field[reached] = -distance[reached] * FLEE_SCALE[0] // FLEE_SCALE[1]
+            tcod.path.dijkstra2d(field, self._cost(), 1, 1)
+            field = self._store(key, field)
+        return field
+
+    def preferred_range(self, target: Actor, preferred: int) -> np.ndarray:
+        """Lower is closer to being `preferred` steps away from `target`."""
+        key = ("range", target.x, target.y, preferred)
+        field = self._cached(key)
+        if field is None:
+            distance = self.distance_from(target.x, target.y)
+            reached = distance != UNREACHABLE
+            field = np.full(distance.shape, UNREACHABLE, dtype=np.int32, order="F")
+            field[reached] = np.abs(distance[reached] - preferred)
+            tcod.path.dijkstra2d(field, self._cost(), 1, 1)
+            field = self._store(key, field)
+        return field
+
+    @staticmethod
+    def downhill_step(field: np.ndarray, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Return the (dx, dy) towards the lowest neighbouring value of
+        `field`, or None if no neighbour is lower than (x, y)."""
+        width, height = field.shape
+        x0, x1 = max(x - 1, 0), min(x + 2, width)
+        y0, y1 = max(y - 1, 0), min(y + 2, height)
+        window = field[x0:x1, y0:y1]
+        best = np.unravel_index(np.argmin(window), window.shape)
+        if window[best] >= field[x, y]:
+            return None
+        return int(best[0]) + x0 - x, int(best[1]) + y0 - y
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+from typing import Optional, Tuple
+
+import numpy as np  # type: ignore
+import tcod
+
+# Maps with more cells than this are not precomputed, the table grows with
+# the square of the cell count (4096 cells is 2MB).
+MAX_CELLS = 4096
+
+
+class LineOfSightOracle:
+    """
+    Precomputed line of sight between every pair of cells on a static map.
+
+    One FOV is computed from every transparent cell on a background thread and
+    stored bit-packed, one row per viewpoint. Once built, `can_see` is a
+    single bit lookup. The oracle only knows the transparency it was built
+    from, so the map throws it away and builds a new one when tiles change.
+    """
+
+    def __init__(self, transparent: np.ndarray):
+        self.width, self.height = transparent.shape
+        self.transparent = np.array(transparent, dtype=bool, order="F")  # Own copy, the map may change.
+        self.rows: Optional[np.ndarray] = None
+        self.cancelled = False
+
+    @property
+    def ready(self) -> bool:
+        return self.rows is not None
+
+    def start(self) -> bool:
+        """Start building in the background. Returns False if the map is too big."""
+        if self.width * self.height > MAX_CELLS:
+            return False
+        thread = threading.Thread(target=self.build, name="rugpg_los_oracle_thread")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def build(self) -> None:
+        width, height = self.width, self.height
+        cells = width * height
+        rows = np.zeros((cells, (cells + 7) // 8), dtype=np.uint8)
+        for x in range(width):
+            for y in range(height):
+                if self.cancelled:
+                    return
+                if not self.transparent[x, y]:
+                    continue  # Nothing stands inside walls, leave the row empty.
+                fov = tcod.map.compute_fov(self.transparent, (x, y), radius=0)
+                rows[x * height + y] = np.packbits(fov.ravel())
+        if not self.cancelled:
+            self.rows = rows
+
+    def can_see(self, a: Tuple[int, int], b: Tuple[int, int]) -> Optional[bool]:
+        """Return True if `b` is in the FOV from `a`, or None if not built yet."""
+        rows = self.rows
+        if rows is None:
+            return None
+        index = b[0] * self.height + b[1]
+        return bool(rows[a[0] * self.height + a[1], index >> 3] & (0x80 >> (index & 7)))
+
+    def seen_from(self, a: Tuple[int, int], xs: np.ndarray, ys: np.ndarray) -> Optional[np.ndarray]:
+        """Vectorized `can_see` from `a` to every (xs[i], ys[i])."""
+        rows = self.rows
+        if rows is None:
+            return None
+        row = rows[a[0] * self.height + a[1]]
+        index = np.asarray(xs) * self.height + np.asarray(ys)
+        return (row[index >> 3] & (0x80 >> (index & 7))).astype(bool)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import io
+import lzma
+import pickle
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from Entities import entity_factories
+from Map import tile_types
+from Map.game_map import GameMap
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from Entities.entity import Entity
+    from Map.prefabs import Prefab
+
+CHUNK_SIZE = 32
+# Chunks across the part of the overworld held as a GameMap, centred on the
+# player. Must leave room for the camera view on both sides of the player.
+WINDOW_CHUNKS = 5
+WORLD_CHUNKS = (48, 32)  # The size of the whole overworld, in chunks.
+HOT_CHUNKS = 64  # Chunks out of the window kept whole, older ones are compressed.
+
+Chunk = Tuple[int, int]
+
+
+class ChunkRecord:
+    """A chunk taken out of the window: its tiles, what was explored and the
+    entities standing on it, with their positions relative to the chunk."""
+
+    def __init__(self, tiles: np.ndarray, explored: np.ndarray, entities: List[Entity]):
+        self.tiles = tiles
+        self.explored = explored
+        self.entities = entities
+
+
+class _ChunkPickler(pickle.Pickler):
+    """Pickles a chunk, leaving out the engine, the player and the map."""
+
+    def __init__(self, file, game_map: GameMap):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.game_map = game_map
+
+    def persistent_id(self, obj):
+        if obj is self.game_map.engine:
+            return "engine"
+        if obj is self.game_map.engine.player:
+            return "player"
+        if obj is self.game_map:
+            return "map"
+        return None
+
+
+class _ChunkUnpickler(pickle.Unpickler):
+    def __init__(self, file, game_map: GameMap):
+        super().__init__(file)
+        self.game_map = game_map
+
+    def persistent_load(self, pid):
+        if pid == "engine":
+            return self.game_map.engine
+        if pid == "player":
+            return self.game_map.engine.player
+        if pid == "map":
+            return self.game_map
+        raise pickle.UnpicklingError(f"unknown persistent id {pid!r}")
+
+
+class ChunkStore:
+    """
+    Chunks that have been visited but are out of the window.
+
+    The `capacity` most recently left chunks are kept whole, older ones are
+    kept pickled and compressed. Both are saved with the game, like the
+    floors in a FloorStore. Chunks never visited aren't stored at all, they
+    are generated when first needed.
+    """
+
+    def __init__(self, capacity: int = HOT_CHUNKS):
+        self.capacity = capacity
+        self.hot: "OrderedDict[Chunk, ChunkRecord]" = OrderedDict()
+        self.cold: Dict[Chunk, bytes] = {}
+
+    def __contains__(self, chunk: Chunk) -> bool:
+        return chunk in self.hot or chunk in self.cold
+
+    def put(self, chunk: Chunk, record: ChunkRecord, game_map: GameMap) -> None:
+        self.hot[chunk] = record
+        self.hot.move_to_end(chunk)
+        while len(self.hot) > self.capacity:
+            old_chunk, old_record = self.hot.popitem(last=False)
+            buffer = io.BytesIO()
+            _ChunkPickler(buffer, game_map).dump(old_record)
+            self.cold[old_chunk] = lzma.compress(buffer.getvalue())
+
+    def take(self, chunk: Chunk, game_map: GameMap) -> Optional[ChunkRecord]:
+        """Remove and return a stored chunk, or None if it must be generated."""
+        record = self.hot.pop(chunk, None)
+        if record is not None:
+            return record
+        cold = self.cold.pop(chunk, None)
+        if cold is None:
+            return None
+        return _ChunkUnpickler(io.BytesIO(lzma.decompress(cold)), game_map).load()
+
+
+def _lattice(seed: int, salt: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """A repeatable random value in [0, 1) for each lattice point."""
+    h = xs.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    h ^= ys.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+    h ^= np.uint64((seed * 0x100000001B3 + salt) & 0xFFFFFFFFFFFFFFFF)
+    h ^= h >> np.uint64(31)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(29)
+    return (h >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def value_noise(seed: int, salt: int, xs: np.ndarray, ys: np.ndarray, scale: int) -> np.ndarray:
+    """Smooth noise in [0, 1) at world positions, seamless across chunks."""
+    gx, gy = xs // scale, ys // scale
+    fx, fy = (xs % scale) / scale, (ys % scale) / scale
+    fx, fy = fx * fx * (3 - 2 * fx), fy * fy * (3 - 2 * fy)
+    top = _lattice(seed, salt, gx, gy) * (1 - fx) + _lattice(seed, salt, gx + 1, gy) * fx
+    bottom = _lattice(seed, salt, gx, gy + 1) * (1 - fx) + _lattice(seed, salt, gx + 1, gy + 1) * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def generate_wilderness(seed: int, chunk: Chunk) -> Tuple[np.ndarray, List[Tuple[Entity, int, int]]]:
+    """Generate one chunk of the snowy land around the mountain.
+
+    Returns the chunk's tiles and the entities to spawn as (prototype, x, y),
+    relative to the chunk.
+    """
+    x0, y0 = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+    xs, ys = np.mgrid[x0:x0 + CHUNK_SIZE, y0:y0 + CHUNK_SIZE]
+    rng = np.random.default_rng([seed, chunk[0], chunk[1]])
+
+    snow = np.stack([tile_types.snow, tile_types.snow2, tile_types.snow3])
+    tiles = np.asfortranarray(snow[rng.integers(0, len(snow), xs.shape)])
+
+    forest = value_noise(seed, 1, xs, ys, 24)
+    rock = value_noise(seed, 2, xs, ys, 12)
+    # The mountain runs along the north edge of the world.
+    mountain_height = 4 + 8 * value_noise(seed, 3, xs, np.zeros_like(ys), 16)
+    world_width, world_height = WORLD_CHUNKS[0] * CHUNK_SIZE, WORLD_CHUNKS[1] * CHUNK_SIZE
+    border = (xs == 0) | (ys == 0) | (xs == world_width - 1) | (ys == world_height - 1)
+    walls = border | (ys < mountain_height) | (rock > 0.82)
+    tiles[walls] = tile_types.wall
+
+    roll = rng.random(xs.shape)
+    open_ground = ~walls
+    trees = open_ground & (roll < np.clip(forest - 0.45, 0, 1) * 0.9)
+    drifts = open_ground & ~trees & (roll > 0.985)
+    spawns = [(entity_factories.tree, int(x), int(y)) for x, y in zip(*np.nonzero(trees))]
+    spawns += [(entity_factories.snowdrift, int(x), int(y)) for x, y in zip(*np.nonzero(drifts))]
+    return tiles, spawns
+
+
+class OverworldMap(GameMap):
+    """
+    A floor far larger than a GameMap, split into chunks of CHUNK_SIZE cells.
+
+    Only a window of WINDOW_CHUNKS x WINDOW_CHUNKS chunks around the player
+    exists as map arrays and entities. Everything else works on the window
+    as on any other map, map positions are window positions. When the player
+    walks into another chunk the window moves with them: chunks falling out
+    of it go to the ChunkStore and chunks coming in are loaded from it, or
+    generated the first time. Memory and generation time follow where the
+    player has been rather than the size of the world.
+    """
+
+    def __init__(self, engine: Engine, prefab: Prefab, prefab_chunk: Chunk, seed: int):
+        size = WINDOW_CHUNKS * CHUNK_SIZE
+        super().__init__(engine, size, size, entities=[engine.player])
+        self.seed = seed
+        self.chunks = ChunkStore()
+        # The hand made start area, in world positions.
+        self.prefab_origin = (prefab_chunk[0] * CHUNK_SIZE, prefab_chunk[1] * CHUNK_SIZE)
+        self.prefab_size = (prefab.width, prefab.height)
+
+        xs, ys = np.nonzero(prefab.glyphs == prefab.palette.player)
+        start = (self.prefab_origin[0] + int(xs[0]), self.prefab_origin[1] + int(ys[0]))
+        self.origin = self._window_origin(start)
+        for chunk in self._window_chunks(self.origin):
+            self._generate(chunk)
+        prefab.stamp(self, *self.world_to_local(*self.prefab_origin))
+
+    def world_to_local(self, x: int, y: int) -> Tuple[int, int]:
+        return x - self.origin[0] * CHUNK_SIZE, y - self.origin[1] * CHUNK_SIZE
+
+    def local_to_world(self, x: int, y: int) -> Tuple[int, int]:
+        return x + self.origin[0] * CHUNK_SIZE, y + self.origin[1] * CHUNK_SIZE
+
+    def _window_origin(self, world: Tuple[int, int]) -> Chunk:
+        """The window position that puts the chunk holding `world` in the middle."""
+        return tuple(
+            max(0, min(world[axis] // CHUNK_SIZE - WINDOW_CHUNKS // 2, WORLD_CHUNKS[axis] - WINDOW_CHUNKS))
+            for axis in range(2)
+        )
+
+    @staticmethod
+    def _window_chunks(origin: Chunk) -> List[Chunk]:
+        return [
+            (origin[0] + i, origin[1] + j) for i in range(WINDOW_CHUNKS) for j in range(WINDOW_CHUNKS)
+        ]
+
+    def _chunk_slices(self, chunk: Chunk) -> Tuple[slice, slice]:
+        x, y = (chunk[0] - self.origin[0]) * CHUNK_SIZE, (chunk[1] - self.origin[1]) * CHUNK_SIZE
+        return slice(x, x + CHUNK_SIZE), slice(y, y + CHUNK_SIZE)
+
+    def stream_around(self, entity: Entity) -> None:
+        origin = self._window_origin(self.local_to_world(entity.x, entity.y))
+        if origin != self.origin:
+            self._move_window(origin)
+
+    def _generate(self, chunk: Chunk) -> None:
+        tiles, spawns = generate_wilderness(self.seed, chunk)
+        view = self._chunk_slices(chunk)
+        self.tiles[view] = tiles
+        left, top = self.world_to_local(*self.prefab_origin)
+        for prototype, x, y in spawns:
+            x, y = x + view[0].start, y + view[1].start
+            if left <= x < left + self.prefab_size[0] and top <= y < top + self.prefab_size[1]:
+                continue  # The start area is stamped over this.
+            prototype.spawn(self, x, y)
+
+    def _take_out(self, chunk: Chunk) -> ChunkRecord:
+        view = self._chunk_slices(chunk)
+        entities = [
+            entity for entity in self.entities
+            if entity is not self.engine.player
+            and view[0].start <= entity.x < view[0].stop and view[1].start <= entity.y < view[1].stop
+        ]
+        for entity in entities:
+            self.remove_entity(entity)
+            entity.x -= view[0].start
+            entity.y -= view[1].start
+        return ChunkRecord(self.tiles[view].copy(), self.explored[view].copy(), entities)
+
+    def _put_in(self, chunk: Chunk, record: ChunkRecord) -> None:
+        view = self._chunk_slices(chunk)
+        self.tiles[view] = record.tiles
+        self.explored[view] = record.explored
+        for entity in record.entities:
+            entity.x += view[0].start
+            entity.y += view[1].start
+            entity.parent = self
+            self.add_entity(entity)
+
+    def _move_window(self, origin: Chunk) -> None:
+        old_chunks = set(self._window_chunks(self.origin))
+        new_chunks = set(self._window_chunks(origin))
+        for chunk in sorted(old_chunks - new_chunks):
+            self.chunks.put(chunk, self._take_out(chunk), self)
+
+        # Slide what stays in the window over to its new place.
+        dx = (self.origin[0] - origin[0]) * CHUNK_SIZE
+        dy = (self.origin[1] - origin[1]) * CHUNK_SIZE
+        for grid in (self.tiles, self.explored, self.seen):
+            moved = grid.copy()
+            grid[max(dx, 0):grid.shape[0] + min(dx, 0), max(dy, 0):grid.shape[1] + min(dy, 0)] = \
+                moved[max(-dx, 0):grid.shape[0] + min(-dx, 0), max(-dy, 0):grid.shape[1] + min(-dy, 0)]
+        for entity in list(self.entities):
+            self.remove_entity(entity)
+            entity.x += dx
+            entity.y += dy
+            self.add_entity(entity)
+            ai = getattr(entity, "ai", None)
+            while ai is not None:
+                if getattr(ai, "path", None):
+                    ai.path = []  # Paths are in window positions, they are found again.
+                ai = getattr(ai, "previous_ai", None)
+        self.downstairs_location = (self.downstairs_location[0] + dx, self.downstairs_location[1] + dy)
+        if self.upstairs_location is not None:
+            self.upstairs_location = (self.upstairs_location[0] + dx, self.upstairs_location[1] + dy)
+        mouse_x, mouse_y = self.engine.mouse_location
+        self.engine.mouse_location = (mouse_x + dx, mouse_y + dy)
+        self.origin = origin
+
+        for chunk in sorted(new_chunks - old_chunks):
+            record = self.chunks.take(chunk, self)
+            if record is None:
+                self._generate(chunk)
+            else:
+                self._put_in(chunk, record)
+
+        self.visible[...] = False
+        self.noise_sources.clear()
+        self.noise_field = None
+        self.tiles_changed()
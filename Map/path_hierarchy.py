@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+import scipy.sparse  # type: ignore
+import scipy.sparse.csgraph  # type: ignore
+import tcod
+
+if TYPE_CHECKING:
+    from Map.game_map import GameMap
+
+CLUSTER_SIZE = 16
+# Maps with fewer cells than this are searched directly, the hierarchy only
+# pays off on large maps.
+MIN_CELLS = 128 * 128
+# Crossings of a cluster border longer than this get a portal at each end
+# instead of one in the middle.
+WIDE_CROSSING = 6
+GOAL_FIELDS = 16  # Destinations whose portal distances are kept.
+CROWD_COST = 10  # Extra cost of a cell a blocking entity stands on, as in BaseAI.get_path_to.
+
+Cell = Tuple[int, int]
+Cluster = Tuple[int, int]
+UNREACHABLE = np.iinfo(np.int32).max
+
+
+class PathHierarchy:
+    """
+    HPA* style pathfinding for large maps.
+
+    The map is cut into clusters of CLUSTER_SIZE cells. Where two clusters
+    touch with walkable cells on both sides there is a pair of portals, and
+    every portal has an edge to each portal of its cluster it can walk to,
+    weighted by the walking cost. A path is found on this small portal graph
+    first and then refined into cells one cluster at a time.
+
+    For each destination the walking cost from every portal to it is kept, so
+    a crowd chasing the same target shares one search over the portal graph.
+    The graph is built from the walkable tiles and, when the map reports its
+    tiles changed, only the clusters whose tiles changed are rebuilt.
+    """
+
+    def __init__(self, game_map: GameMap):
+        self.game_map = game_map
+        self.width, self.height = game_map.width, game_map.height
+        self.clusters_x = -(-self.width // CLUSTER_SIZE)
+        self.clusters_y = -(-self.height // CLUSTER_SIZE)
+        self.walkable = np.zeros((self.width, self.height), dtype=bool, order="F")
+        self.version: Optional[int] = None
+        # Portal cells by cluster, counted as a cell can be a portal of two borders.
+        self.portals: Dict[Cluster, Counter] = {}
+        self.borders: Dict[Tuple[Cluster, Cluster], List[Tuple[Cell, Cell]]] = {}
+        self.edges: Dict[Cell, Dict[Cell, int]] = {}
+        self._goal_fields: "OrderedDict[Cell, GoalField]" = OrderedDict()
+        self._segments: Dict[Tuple[Cell, Cell], List[Cell]] = {}
+        self._graph: Optional[tuple] = None
+
+    # Building the graph.
+
+    def cluster_of(self, x: int, y: int) -> Cluster:
+        return x // CLUSTER_SIZE, y // CLUSTER_SIZE
+
+    def _slices(self, cluster: Cluster) -> Tuple[slice, slice]:
+        x, y = cluster[0] * CLUSTER_SIZE, cluster[1] * CLUSTER_SIZE
+        return slice(x, min(x + CLUSTER_SIZE, self.width)), slice(y, min(y + CLUSTER_SIZE, self.height))
+
+    def update(self) -> None:
+        """Bring the graph up to date with the map's tiles."""
+        if self.version == self.game_map.transparency_version:
+            return
+        walkable = self.game_map.tiles["walkable"]
+        changed = walkable != self.walkable
+        self.walkable = np.array(walkable, dtype=bool, order="F")
+        self.version = self.game_map.transparency_version
+        if not changed.any():
+            return
+        self._goal_fields.clear()
+        self._graph = None
+
+        xs, ys = np.nonzero(changed)
+        dirty = set(zip((xs // CLUSTER_SIZE).tolist(), (ys // CLUSTER_SIZE).tolist()))
+        self._segments.clear()
+        rebuilt = set(dirty)
+        for cluster in dirty:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    neighbour = (cluster[0] + dx, cluster[1] + dy)
+                    if neighbour != cluster and 0 <= neighbour[0] < self.clusters_x and 0 <= neighbour[1] < self.clusters_y:
+                        self._build_border(min(cluster, neighbour), max(cluster, neighbour))
+                        rebuilt.add(neighbour)
+        for cluster in rebuilt:
+            self._build_cluster_edges(cluster)
+
+    def _remove_portal(self, cluster: Cluster, cell: Cell) -> None:
+        portals = self.portals[cluster]
+        portals[cell] -= 1
+        if portals[cell] > 0:
+            return
+        del portals[cell]
+        for other in self.edges.pop(cell, {}):
+            self.edges.get(other, {}).pop(cell, None)
+
+    def _build_border(self, a: Cluster, b: Cluster) -> None:
+        """Find the crossings between two neighbouring clusters."""
+        for cell_a, cell_b in self.borders.pop((a, b), ()):
+            self._remove_portal(a, cell_a)
+            self._remove_portal(b, cell_b)
+
+        if a[0] != b[0] and a[1] != b[1]:
+            pairs = self._corner_crossing(a, b)
+        else:
+            pairs = self._side_crossings(a, b)
+
+        for cell_a, cell_b in pairs:
+            self.portals.setdefault(a, Counter())[cell_a] += 1
+            self.portals.setdefault(b, Counter())[cell_b] += 1
+            step = 2 if cell_a[0] == cell_b[0] or cell_a[1] == cell_b[1] else 3
+            self.edges.setdefault(cell_a, {})[cell_b] = step
+            self.edges.setdefault(cell_b, {})[cell_a] = step
+        self.borders[(a, b)] = pairs
+
+    def _side_crossings(self, a: Cluster, b: Cluster) -> List[Tuple[Cell, Cell]]:
+        """Crossings between a cluster and the one right of or below it,
+        including diagonal steps over the border."""
+        slices_a = self._slices(a)
+        if a[0] != b[0]:  # Side by side.
+            line = slices_a[0].stop - 1
+            span = np.arange(slices_a[1].start, slices_a[1].stop)
+            near, far = self.walkable[line, span], self.walkable[line + 1, span]
+            cell = lambda offset, i: (line + offset, i)
+        else:  # One above the other.
+            line = slices_a[1].stop - 1
+            span = np.arange(slices_a[0].start, slices_a[0].stop)
+            near, far = self.walkable[span, line], self.walkable[span, line + 1]
+            cell = lambda offset, i: (i, line + offset)
+
+        straight = near & far
+        before = np.zeros_like(near)
+        before[1:] = near[1:] & far[:-1]
+        after = np.zeros_like(near)
+        after[:-1] = near[:-1] & far[1:]
+        crossable = straight | before | after
+
+        pairs = []
+        runs = np.flatnonzero(np.diff(np.concatenate(([False], crossable, [False])).astype(np.int8)))
+        for start, stop in zip(runs[::2].tolist(), runs[1::2].tolist()):
+            picks = [start, stop - 1] if stop - start > WIDE_CROSSING else [(start + stop - 1) // 2]
+            for i in picks:
+                j = i if straight[i] else i - 1 if before[i] else i + 1
+                pairs.append((cell(0, int(span[i])), cell(1, int(span[j]))))
+        return pairs
+
+    def _corner_crossing(self, a: Cluster, b: Cluster) -> List[Tuple[Cell, Cell]]:
+        """The diagonal step between the touching corners of two clusters, if open."""
+        slices_a, slices_b = self._slices(a), self._slices(b)
+        corner_a = tuple(
+            slices_a[axis].stop - 1 if b[axis] > a[axis] else slices_a[axis].start for axis in range(2)
+        )
+        corner_b = tuple(
+            slices_b[axis].start if b[axis] > a[axis] else slices_b[axis].stop - 1 for axis in range(2)
+        )
+        if self.walkable[corner_a] and self.walkable[corner_b]:
+            return [(corner_a, corner_b)]
+        return []
+
+    def _local_distances(self, cluster: Cluster, start: Cell) -> np.ndarray:
+        """The walking cost from `start` to every cell of a cluster, staying inside it."""
+        view = self._slices(cluster)
+        cost = self.walkable[view].astype(np.int8)
+        distance = np.full(cost.shape, UNREACHABLE, dtype=np.int32, order="F")
+        distance[start[0] - view[0].start, start[1] - view[1].start] = 0
+        tcod.path.dijkstra2d(distance, cost, 2, 3)
+        return distance
+
+    def _build_cluster_edges(self, cluster: Cluster) -> None:
+        portals = list(self.portals.get(cluster, ()))
+        members = set(portals)
+        for cell in portals:
+            edges = self.edges.setdefault(cell, {})
+            for other in [other for other in edges if other in members]:
+                del edges[other]
+        view = self._slices(cluster)
+        for i, cell in enumerate(portals):
+            distance = self._local_distances(cluster, cell)
+            for other in portals[i + 1:]:
+                cost = int(distance[other[0] - view[0].start, other[1] - view[1].start])
+                if cost != UNREACHABLE:
+                    self.edges[cell][other] = cost
+                    self.edges[other][cell] = cost
+
+    # Searching.
+
+    def _portal_graph(self) -> Tuple[List[Cell], Dict[Cell, int], np.ndarray, np.ndarray, np.ndarray]:
+        """The portal graph as node cells, their indexes and edge arrays
+        (from, to, cost), rebuilt after the graph changed."""
+        if self._graph is None:
+            nodes = list(self.edges)
+            index = {cell: i for i, cell in enumerate(nodes)}
+            pairs = [(index[cell], index[other], cost)
+                     for cell, edges in self.edges.items() for other, cost in edges.items()]
+            rows, cols, costs = (np.array(column, dtype=np.int64) for column in zip(*pairs)) if pairs else (
+                np.zeros(0, dtype=np.int64),) * 3
+            self._graph = (nodes, index, rows, cols, costs)
+        return self._graph
+
+    def _goal_field(self, goal: Cell) -> GoalField:
+        """The cost from every portal to `goal` and the next portal on the way."""
+        field = self._goal_fields.get(goal)
+        if field is not None:
+            self._goal_fields.move_to_end(goal)
+            return field
+
+        nodes, index, rows, cols, costs = self._portal_graph()
+        cluster = self.cluster_of(*goal)
+        view = self._slices(cluster)
+        local = self._local_distances(cluster, goal)
+        roots = [cell for cell in self.portals.get(cluster, ())
+                 if local[cell[0] - view[0].start, cell[1] - view[1].start] != UNREACHABLE]
+        # The goal joins the graph as one extra node, linked to the portals of
+        # its cluster. Links cost one more than the walk so none weighs zero.
+        goal_node = len(nodes)
+        rows = np.concatenate((rows, np.full(len(roots), goal_node)))
+        cols = np.concatenate((cols, [index[cell] for cell in roots])).astype(np.int64)
+        costs = np.concatenate((costs, [local[cell[0] - view[0].start, cell[1] - view[1].start] + 1 for cell in roots]))
+        graph = scipy.sparse.csr_matrix((costs, (rows, cols)), shape=(goal_node + 1, goal_node + 1))
+        cost, predecessors = scipy.sparse.csgraph.dijkstra(
+            graph, directed=True, indices=goal_node, return_predecessors=True
+        )
+        field = self._goal_fields[goal] = GoalField(nodes, index, cost - 1, predecessors, goal_node)
+        if len(self._goal_fields) > GOAL_FIELDS:
+            self._goal_fields.popitem(last=False)
+        return field
+
+    def _crowd_cost(self, x: slice, y: slice) -> np.ndarray:
+        walkable = self.game_map.tiles["walkable"][x, y]
+        cost = np.array(walkable, dtype=np.int8)
+        cost[self.game_map.blocked[x, y] & walkable] += CROWD_COST
+        return cost
+
+    def _local_path(self, start: Cell, goal: Cell, x: slice, y: slice, crowd: bool = True) -> List[Cell]:
+        """The cheapest walk between two cells inside an area of the map,
+        excluding `start`. Empty if there is no way through the area. Without
+        `crowd` blocking entities are ignored."""
+        cost = self._crowd_cost(x, y) if crowd else self.walkable[x, y].astype(np.int8)
+        distance = np.full(cost.shape, UNREACHABLE, dtype=np.int32, order="F")
+        distance[goal[0] - x.start, goal[1] - y.start] = 0
+        tcod.path.dijkstra2d(distance, cost, 2, 3)
+        local_start = (start[0] - x.start, start[1] - y.start)
+        if distance[local_start] == UNREACHABLE:
+            return []
+        path = tcod.path.hillclimb2d(distance, local_start, True, True)[1:].tolist()
+        return [(cell_x + x.start, cell_y + y.start) for cell_x, cell_y in path]
+
+    def _segment(self, start: Cell, goal: Cell) -> List[Cell]:
+        """The cells between two portals of one cluster. These don't depend on
+        who is walking, so they are kept until the tiles change."""
+        segment = self._segments.get((start, goal))
+        if segment is None:
+            segment = self._local_path(start, goal, *self._slices(self.cluster_of(*start)), crowd=False)
+            self._segments[(start, goal)] = segment
+        return segment
+
+    def path(self, start: Cell, goal: Cell) -> List[Cell]:
+        """The cells to walk from `start` to `goal`, excluding `start`. Empty if
+        `goal` can't be reached."""
+        if start == goal or not self.game_map.tiles["walkable"][goal]:
+            return []
+
+        # Close by, a search of the surrounding area is cheaper than the graph.
+        if max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) <= CLUSTER_SIZE:
+            margin = CLUSTER_SIZE // 2
+            x = slice(max(0, min(start[0], goal[0]) - margin), min(self.width, max(start[0], goal[0]) + margin + 1))
+            y = slice(max(0, min(start[1], goal[1]) - margin), min(self.height, max(start[1], goal[1]) + margin + 1))
+            path = self._local_path(start, goal, x, y)
+            if path:
+                return path
+
+        self.update()
+        cluster = self.cluster_of(*start)
+        view = self._slices(cluster)
+        local = self._local_distances(cluster, start)
+        exits = {}
+        for cell in self.portals.get(cluster, ()):
+            value = int(local[cell[0] - view[0].start, cell[1] - view[1].start])
+            if value != UNREACHABLE:
+                exits[cell] = value
+        field = self._goal_field(goal)
+        best, best_cost = field.best_exit(exits)
+        if cluster == self.cluster_of(*goal):
+            direct = int(local[goal[0] - view[0].start, goal[1] - view[1].start])
+            if direct != UNREACHABLE and direct <= best_cost:
+                return self._local_path(start, goal, *view)
+        if best is None:
+            return []
+
+        # Walk the portals and fill in the cells between them.
+        path = self._local_path(start, best, *view) if best != start else []
+        cell = best
+        while field.towards(cell) is not None:
+            following = field.towards(cell)
+            if self.cluster_of(*following) != self.cluster_of(*cell):
+                path.append(following)  # A border crossing is one step.
+            else:
+                path += self._segment(cell, following)
+            cell = following
+        if cell != goal:
+            path += self._local_path(cell, goal, *self._slices(self.cluster_of(*goal)))
+        return path
+
+
+class GoalField:
+    """The walking cost from each portal to one destination, and the next
+    portal on the way there."""
+
+    def __init__(self, nodes: List[Cell], index: Dict[Cell, int], cost: np.ndarray,
+                 predecessors: np.ndarray, goal_node: int):
+        self.nodes = nodes
+        self.index = index
+        self.cost = cost
+        self.predecessors = predecessors
+        self.goal_node = goal_node
+
+    def towards(self, cell: Cell) -> Optional[Cell]:
+        """The next portal from `cell`, None if the goal is in its cluster."""
+        following = self.predecessors[self.index[cell]]
+        return None if following == self.goal_node else self.nodes[following]
+
+    def best_exit(self, exits: Dict[Cell, int]) -> Tuple[Optional[Cell], float]:
+        """Of the portals `exits` maps to the cost of reaching them, the one
+        with the lowest total cost to the goal, and that cost."""
+        best, best_cost = None, np.inf
+        for cell, value in exits.items():
+            total = value + self.cost[self.index[cell]]
+            if total < best_cost:
+                best, best_cost = cell, total
+        return best, best_cost
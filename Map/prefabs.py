@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import os
+import random
+from typing import Dict, List, Mapping, Optional, Sequence, Union, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+
+from Entities import entity_factories
+from Map import tile_types
+
+if TYPE_CHECKING:
+    from Entities.entity import Entity
+    from Map.game_map import GameMap
+
+# Compiled prefabs are stored here as .npz files named after the source file
+# and a hash of its contents, so an edited map is recompiled automatically.
+CACHE_DIR = "prefab_cache"
+
+TileChoice = Union[np.ndarray, Sequence[np.ndarray]]
+
+
+class Palette:
+    """
+    What each glyph of a prefab stands for.
+
+    `tiles` maps a glyph to a tile, or to a sequence of tiles of which one is
+    picked at random per cell. `spawns` maps a glyph to the entities spawned
+    there. The `player` glyph marks where the player is placed. Glyphs with
+    no tile leave the map as it was.
+    """
+
+    def __init__(
+        self,
+        tiles: Mapping[str, TileChoice],
+        spawns: Optional[Mapping[str, Sequence[Entity]]] = None,
+        player: Optional[str] = "p",
+    ):
+        self.tiles = {
+            glyph: np.stack([tile] if isinstance(tile, np.ndarray) else list(tile))
+            for glyph, tile in tiles.items()
+        }
+        self.spawns = dict(spawns or {})
+        self.player = player
+
+
+class Prefab:
+    """A hand made map: a grid of glyphs, indexed [x, y], and the
+    palette to read it with."""
+
+    def __init__(self, glyphs: np.ndarray, palette: Palette):
+        self.glyphs = glyphs
+        self.palette = palette
+
+    @property
+    def width(self) -> int:
+        return self.glyphs.shape[0]
+
+    @property
+    def height(self) -> int:
+        return self.glyphs.shape[1]
+
+    def stamp(self, dungeon: GameMap, x: int = 0, y: int = 0) -> Dict[Entity, List[Entity]]:
+        """Write this prefab onto `dungeon` with its top left corner at (x, y).
+
+        Returns the spawned entities, keyed by the prototype they were spawned
+        from.
+        """
+        palette = self.palette
+        region = dungeon.tiles[x:x + self.width, y:y + self.height]
+        glyphs = self.glyphs[: region.shape[0], : region.shape[1]]
+        rng = np.random.default_rng(random.getrandbits(32))
+
+        for glyph, choices in palette.tiles.items():
+            mask = glyphs == glyph
+            if len(choices) == 1:
+                region[mask] = choices[0]
+            else:
+                region[mask] = choices[rng.integers(0, len(choices), np.count_nonzero(mask))]
+            if choices[0] == tile_types.down_stairs:
+                xs, ys = np.nonzero(mask)
+                if len(xs):
+                    dungeon.downstairs_location = (int(xs[-1]) + x, int(ys[-1]) + y)
+
+        spawned: Dict[Entity, List[Entity]] = {}
+        for glyph, prototypes in palette.spawns.items():
+            xs, ys = np.nonzero(glyphs == glyph)
+            for cell_x, cell_y in zip((xs + x).tolist(), (ys + y).tolist()):
+                for prototype in prototypes:
+                    spawned.setdefault(prototype, []).append(prototype.spawn(dungeon, cell_x, cell_y))
+
+        if palette.player:
+            xs, ys = np.nonzero(glyphs == palette.player)
+            if len(xs):
+                dungeon.engine.player.place(int(xs[0]) + x, int(ys[0]) + y, dungeon)
+
+        dungeon.tiles_changed()
+        return spawned
+
+
+def parse_glyphs(text: str) -> np.ndarray:
+    """Read a comma separated map into a [x, y] array of glyphs."""
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=",", quotechar="|")]
+    width = max((len(row) for row in rows), default=0)
+    grid = np.full((len(rows), width), "", dtype="U1")
+    for y, row in enumerate(rows):
+        grid[y, : len(row)] = row
+    return np.asfortranarray(grid.T)
+
+
+_compiled: Dict[str, np.ndarray] = {}
+
+
+def load_glyphs(filename: str) -> np.ndarray:
+    """Return the glyphs of a map file, from the compiled cache when the
+    file has not changed since it was last compiled."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    glyphs = _compiled.get(digest)
+    if glyphs is not None:
+        return glyphs
+
+    cache_path = os.path.join(CACHE_DIR, f"{os.path.basename(filename)}.{digest}.npz")
+    try:
+        with np.load(cache_path, allow_pickle=False) as compiled:
+            glyphs = compiled["glyphs"]
+    except (OSError, KeyError, ValueError):
+        glyphs = parse_glyphs(data.decode("utf-8-sig"))
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            np.savez(cache_path, glyphs=glyphs)
+        except OSError:
+            pass  # A read-only install still works, just without the cache.
+
+    _compiled[digest] = glyphs
+    return glyphs
+
+
+def load_prefab(filename: str, palette: Palette) -> Prefab:
+    return Prefab(load_glyphs(filename), palette)
+
+
+SURFACE_PALETTE = Palette(
+    tiles={
+        ".": (tile_types.snow, tile_types.snow2, tile_types.snow3),
+        "+": tile_types.floor,
+        "s": tile_types.floor,
+        "c": tile_types.snow,
+        "t": tile_types.snow,
+        "#": tile_types.wall,
+        "0": tile_types.pillar,
+        ">": tile_types.down_stairs,
+        "p": tile_types.snow,
+    },
+    spawns={
+        "s": [entity_factories.statue],
+        "c": [entity_factories.snowdrift],
+        "t": [entity_factories.tree],
+    },
+)
+
+BOSS_PALETTE = Palette(
+    tiles={
+        "+": tile_types.floor,
+        "s": tile_types.floor,
+        "f": tile_types.floor,
+        "v": tile_types.floor,
+        "c": tile_types.floor,
+        "t": tile_types.floor,
+        "#": tile_types.wall,
+        "0": tile_types.pillar,
+        "2": tile_types.floor,
+        "3": tile_types.floor_hidden_wall,
+        "d": tile_types.door,
+        ">": tile_types.down_stairs,
+        "l": tile_types.floor,
+        "p": tile_types.floor,
+    },
+    spawns={
+        "s": [entity_factories.statue],
+        "f": [entity_factories.torch],
+        "v": [entity_factories.candles],
+        "c": [entity_factories.chair, entity_factories.ice_sentry_boss],
+        "t": [entity_factories.stone_plate],
+        "2": [entity_factories.hidden_door_shut_trigger],
+        "l": [entity_factories.ice_shard],
+    },
+)
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-from typing import Any, TYPE_CHECKING, List
+from typing import Any, TYPE_CHECKING, List, Tuple
 from skimage.morphology import flood_fill
 import numpy as np
 import time
@@ -10,8 +10,9 @@ import random
 
 from Entities import entity_factories
 from Map import tile_types, game_map
-from Map.procgen_dungeon import get_max_value_for_floor, max_monsters_by_floor, max_items_by_floor, \
-    get_entities_at_random, enemy_chances, item_chances
+from Map.free_cells import FreeCellIndex
+from Map.procgen_dungeon import roll_room_contents
+from Map.validation import repair_floor
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -115,30 +116,19 @@ def generate_cave2(
         for y in range(0, HEIGHT - 1):
             if tiles[y, x]:
                 tiles2[y, x] = 0
-    valid = False
-    playerx = 0
-    playery = 0
-    while not valid:
-        playerx = random.randrange(1, WIDTH - 1)
-        playery = random.randrange(1, HEIGHT - 1)
-        num = get_neighbors(playery, playerx, tiles2)
-
-        valid = num == 0
+    # The player and the stairs go on floor tiles with no walls around them.
+    open_cells = scipy.signal.convolve2d(tiles2 != 0, np.ones((3, 3)), "same") == 0
+    candidates = FreeCellIndex(open_cells.T)
+    if not len(candidates):
+        candidates = FreeCellIndex(tiles.T)
+    playerx, playery = candidates.choice()
     tiles2[playery, playerx] = 3
-    distance = 0
-    stairsx = 0
-    stairsy = 0
-    valid = False
-    while not valid:
-        stairsx = random.randrange(1, WIDTH - 1)
-        stairsy = random.randrange(1, HEIGHT - 1)
-        num = get_neighbors(stairsy, stairsx, tiles2)
-        dx = stairsx - playerx
-        dy = stairsy - playery
-        valid = num == 0
-        if valid:
-            distance = max(abs(dx), abs(dy))
-            valid = distance > 10
+
+    distance = candidates.chebyshev_from(playerx, playery)
+    stairs = candidates.choice(distance > 10)
+    if stairs is None:
+        stairs = candidates.choice(distance == distance.max())  # As far as this cave allows.
+    stairsx, stairsy = stairs
     tiles2[stairsy, stairsx] = 4
 
     player = engine.player
@@ -157,12 +147,13 @@ def generate_cave2(
 
             if num==3:
                 player.place(x,y,dungeon)
-                # TODO: up stairs
                 dungeon.tiles[x,y]=tile_types.floor
             if num==4:
                 dungeon.tiles[x, y] = tile_types.down_stairs
                 dungeon.downstairs_location = (x, y)
 
+    floor_number = engine.game_world.current_floor
+    light_spots: List[Tuple[int, int]] = []  # Monsters and items gather around these, rolled below.
     for x in range(1, WIDTH - 2):
         for y in range(1, HEIGHT - 2):
             CHANCE_LIGHT = 0.015
@@ -172,8 +163,8 @@ def generate_cave2(
             dy = y - playery
             distance = max(abs(dx), abs(dy))
             if get_neighbors(y, x, tiles2) == 0 and distance>10 and dungeon.tiles[x,y][0]:
-                if n < CHANCE_LIGHT and not dungeon.get_blocking_entity_at_location(x, y):
-                    floor_number = engine.game_world.current_floor
+                if n < CHANCE_LIGHT and not dungeon.blocked[x, y]:
+                    light_spots.append((x, y))
                     n=random.random()
                     if n<0.3:
                         entity_factories.torch.spawn(dungeon, x, y)
@@ -183,7 +174,7 @@ def generate_cave2(
                                 if x2==0 and y2==0:
                                     pass
                                 elif n<0.3:
-                                    if not dungeon.get_blocking_entity_at_location(x+x2, y+y2):
+                                    if not dungeon.blocked[x+x2, y+y2]:
                                         entity_factories.bedroll.spawn(dungeon, x+x2, y+y2)
 
 
@@ -195,36 +186,14 @@ def generate_cave2(
                                 if x2==0 and y2==0:
                                     pass
                                 elif n<0.3:
-                                    if not dungeon.get_blocking_entity_at_location(x+x2, y+y2):
+                                    if not dungeon.blocked[x+x2, y+y2]:
                                         entity_factories.chair.spawn(dungeon, x+x2, y+y2)
                                 elif n<0.4:
-                                    if not dungeon.get_blocking_entity_at_location(x+x2, y+y2):
+                                    if not dungeon.blocked[x+x2, y+y2]:
                                         entity_factories.barrel.spawn(dungeon, x+x2, y+y2)
                     else:
                         entity_factories.statue.spawn(dungeon, x, y)
-
-
-                    number_of_monsters = random.randint(
-                        0, get_max_value_for_floor(max_monsters_by_floor, floor_number)
-                    )
-                    number_of_items = random.randint(
-                        0, get_max_value_for_floor(max_items_by_floor, floor_number)
-                    )
-
-                    monsters: List[Entity] = get_entities_at_random(
-                        enemy_chances, number_of_monsters, floor_number
-                    )
-                    items: List[Entity] = get_entities_at_random(
-                        item_chances, number_of_items, floor_number
-                    )
-
-                    for spawn_entity in monsters + items:
-                        x2 = random.randint(-1, 1)
-                        y2 = random.randint(-1, 1)
-
-                        if not any(entity.x == x + x2 and entity.y == y + y2 and entity.blocks_movement for entity in dungeon.entities):
-                            spawn_entity.spawn(dungeon, x + x2, y + y2)
-                elif n > CHANCE_SHRUB and not dungeon.get_blocking_entity_at_location(x, y) and dungeon.tiles[x,y][0]:
+                elif n > CHANCE_SHRUB and not dungeon.blocked[x, y] and dungeon.tiles[x,y][0]:
                     num_r=random.random()
                     if num_r<0.25:
                         entity_factories.cave_plant.spawn(dungeon, x, y)
@@ -235,8 +204,17 @@ def generate_cave2(
                     else:
                         entity_factories.cave_plant3.spawn(dungeon, x, y)
 
+    # One draw for the whole floor, then fill in around each light spot.
+    for (x, y), (monsters, items) in zip(light_spots, roll_room_contents(floor_number, len(light_spots))):
+        free_cells = dungeon.free_cells((slice(x - 1, x + 2), slice(y - 1, y + 2)), blocking_only=True)
+        for spawn_entity in monsters + items:
+            cell = free_cells.take()
+            if cell is None:
+                break  # No room left around this spot.
+            spawn_entity.spawn(dungeon, *cell)
 
+    repair_floor(dungeon).rejected = rejected
     print("rejected maps: ", rejected, " blob size: ", floor_count)
     end = time.time()
     print("end:", end - start)
-    return dungeon
\ No newline at end of file
+    return dungeon
@@ -3,17 +3,18 @@ from __future__ import annotations
 import numpy as np
 
 from Entities import entity_factories
+from Entities.entity import Entity
 from Map import tile_types, game_map
+from Map.validation import repair_floor
 import Map.tile_types
 import random
-from typing import Dict, Iterator, List, Tuple, TYPE_CHECKING
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
 import tcod
 import cProfile
 import time
 
 if TYPE_CHECKING:
     from engine import Engine
-    from Entities.entity import Entity
     from Map.game_map import GameMap
 
 max_items_by_floor = [
@@ -38,7 +39,7 @@ item_chances: Dict[int, List[Tuple[Entity, int]]] = {
     5: [(entity_factories.fear_scroll, 25),(entity_factories.antimagic_ring, 3),(entity_factories.antivenom_potion, 30)],
     6: [(entity_factories.fireball_scroll, 25), (entity_factories.chain_mail, 15)],
     7: [(entity_factories.charm_scroll, 20)],
-    8: [(entity_factories.charm_scroll, 20, (entity_factories.scale_mail, 15), (entity_factories.red_shroud, 10))],
+    8: [(entity_factories.charm_scroll, 20), (entity_factories.scale_mail, 15), (entity_factories.red_shroud, 10)],
 }
 
 enemy_chances: Dict[int, List[Tuple[Entity, int]]] = {
@@ -66,31 +67,106 @@ def get_max_value_for_floor(
     return current_value
 
 
+def validate_chances(name: str, weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]]) -> None:
+    """Raise ValueError if a spawn table is malformed."""
+    previous_floor = None
+    for floor, values in weighted_chances_by_floor.items():
+        if not isinstance(floor, int) or (previous_floor is not None and floor <= previous_floor):
+            raise ValueError(f"{name}: floors must be integers in increasing order, got {floor!r}")
+        previous_floor = floor
+        for value in values:
+            if (
+                    not isinstance(value, tuple)
+                    or len(value) != 2
+                    or not isinstance(value[0], Entity)
+                    or not isinstance(value[1], int)
+                    or value[1] < 0
+            ):
+                raise ValueError(f"{name}[{floor}]: expected (entity, weight), got {value!r}")
+
+
+class SpawnTable:
+    """
+    The weighted chances of a spawn table as they stand on one floor,
+    compiled into cumulative weights so any number of entities can be drawn
+    with one binary search each.
+    """
+
+    def __init__(self, weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]], floor: int):
+        entity_weighted_chances = {}
+
+        for key, values in weighted_chances_by_floor.items():
+            if key > floor:
+                break
+            else:
+                for entity, weighted_chance in values:
+                    entity_weighted_chances[entity] = weighted_chance
+
+        self.entities = list(entity_weighted_chances.keys())
+        self.cumulative = np.cumsum(list(entity_weighted_chances.values()), dtype=np.float64)
+        self.total = float(self.cumulative[-1]) if len(self.cumulative) else 0.0
+
+    def draw(self, count: int) -> List[Entity]:
+        """Return `count` entities chosen at random by weight."""
+        return self.draw_groups([count])[0]
+
+    def draw_groups(self, counts: Sequence[int]) -> List[List[Entity]]:
+        """Draw `sum(counts)` entities at once and split them into groups."""
+        total_count = int(sum(counts))
+        if not total_count or not self.total:
+            return [[] for _ in counts]
+        rng = np.random.default_rng(random.getrandbits(64))
+        chosen = np.searchsorted(self.cumulative, rng.random(total_count) * self.total, side="right")
+        entities = [self.entities[i] for i in chosen.tolist()]
+        groups = []
+        start = 0
+        for count in counts:
+            groups.append(entities[start:start + count])
+            start += count
+        return groups
+
+
+_spawn_tables: Dict[Tuple[int, int], SpawnTable] = {}
+
+
+def get_spawn_table(
+        weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]], floor: int,
+) -> SpawnTable:
+    """Return the compiled spawn table for `floor`, compiling it the first time."""
+    key = (id(weighted_chances_by_floor), floor)
+    table = _spawn_tables.get(key)
+    if table is None:
+        table = _spawn_tables[key] = SpawnTable(weighted_chances_by_floor, floor)
+    return table
+
+
 def get_entities_at_random(
         weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]],
         number_of_entities: int,
         floor: int,
 ) -> List[Entity]:
-    entity_weighted_chances = {}
+    return get_spawn_table(weighted_chances_by_floor, floor).draw(number_of_entities)
 
-    for key, values in weighted_chances_by_floor.items():
-        if key > floor:
-            break
-        else:
-            for value in values:
-                entity = value[0]
-                weighted_chance = value[1]
 
-                entity_weighted_chances[entity] = weighted_chance
+def roll_room_contents(floor_number: int, rooms: int) -> List[Tuple[List[Entity], List[Entity]]]:
+    """Decide the monsters and items of `rooms` rooms at once.
 
-    entities = list(entity_weighted_chances.keys())
-    entity_weighted_chance_values = list(entity_weighted_chances.values())
+    Returns a (monsters, items) pair per room.
+    """
+    rng = np.random.default_rng(random.getrandbits(64))
+    monster_counts = rng.integers(
+        0, get_max_value_for_floor(max_monsters_by_floor, floor_number), rooms, endpoint=True
+    ).tolist()
+    item_counts = rng.integers(
+        0, get_max_value_for_floor(max_items_by_floor, floor_number), rooms, endpoint=True
+    ).tolist()
+    monsters = get_spawn_table(enemy_chances, floor_number).draw_groups(monster_counts)
+    items = get_spawn_table(item_chances, floor_number).draw_groups(item_counts)
+    return list(zip(monsters, items))
 
-    chosen_entities = random.choices(
-        entities, weights=entity_weighted_chance_values, k=number_of_entities
-    )
 
-    return chosen_entities
+validate_chances("item_chances", item_chances)
+validate_chances("enemy_chances", enemy_chances)
 
 
 class RectangularRoom:
@@ -107,6 +183,11 @@ class RectangularRoom:
 
         return center_x, center_y
 
+    @property
+    def outer(self) -> Tuple[slice, slice]:
+        """Return the whole room, walls included, as a 2D array index."""
+        return slice(self.x1, self.x2 + 1), slice(self.y1, self.y2 + 1)
+
     @property
     def inner(self) -> Tuple[slice, slice]:
         """Return the inner area of this room as a 2D array index."""
@@ -117,6 +198,12 @@ class RectangularRoom:
         """Return the inner area of this room as a 2D array index."""
         return slice(self.x1 + 2, self.x2 - 1), slice(self.y1 + 2, self.y2 - 1)
 
+    @property
+    def inner2_cells(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the x and y coordinates of every cell in `inner2`."""
+        xs, ys = np.mgrid[self.inner2]
+        return xs, ys
+
     def intersects(self, other: RectangularRoom) -> bool:
         """Return True if this room overlaps with another RectangularRoom."""
         return (
@@ -127,33 +214,31 @@ class RectangularRoom:
         )
 
 
-def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int, ) -> None:
-    number_of_monsters = random.randint(
-        0, get_max_value_for_floor(max_monsters_by_floor, floor_number)
-    )
-    number_of_items = random.randint(
-        0, get_max_value_for_floor(max_items_by_floor, floor_number)
-    )
-
-    monsters: List[Entity] = get_entities_at_random(
-        enemy_chances, number_of_monsters, floor_number
-    )
-    items: List[Entity] = get_entities_at_random(
-        item_chances, number_of_items, floor_number
-    )
+def place_entities(
+        room: RectangularRoom,
+        dungeon: GameMap,
+        floor_number: int,
+        contents: Optional[Tuple[List[Entity], List[Entity]]] = None,
+) -> None:
+    """Spawn the monsters and items in `contents` inside `room`, rolling them
+    first if they were not rolled in advance by `roll_room_contents`."""
+    if contents is None:
+        contents = roll_room_contents(floor_number, 1)[0]
+    monsters, items = contents
 
+    free_cells = dungeon.free_cells(room.inner)
     for spawn_entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
-
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            spawn_entity.spawn(dungeon, x, y)
+        cell = free_cells.take()
+        if cell is None:
+            break  # The room is full.
+        spawn_entity.spawn(dungeon, *cell)
 
 
 def tunnel_between(
         start: Tuple[int, int], end: Tuple[int, int]
-) -> Iterator[Tuple[int, int]]:
-    """Return an L-shaped tunnel between these two points."""
+) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+    """Return the two legs of an L-shaped tunnel between these two points,
+    each as a 2D array index."""
     x1, y1 = start
     x2, y2 = end
     if random.random() < 0.5:  # 50% chance.
@@ -163,27 +248,41 @@ def tunnel_between(
         # Move vertically, then horizontally.
         corner_x, corner_y = x1, y2
 
-    # Generate the coordinates for this tunnel.
-    for x, y in tcod.los.bresenham((x1, y1), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist():
-        yield x, y
+    def leg(ax: int, ay: int, bx: int, by: int) -> Tuple[slice, slice]:
+        return slice(min(ax, bx), max(ax, bx) + 1), slice(min(ay, by), max(ay, by) + 1)
 
+    return leg(x1, y1, corner_x, corner_y), leg(corner_x, corner_y, x2, y2)
 
-def generate_dungeon(
+
+def carve_tunnel(dungeon: GameMap, start: Tuple[int, int], end: Tuple[int, int]) -> None:
+    """Dig an L-shaped tunnel, leaving floors that are already walkable alone."""
+    for leg in tunnel_between(start, end):
+        cells = dungeon.tiles[leg]  # A view, writes go straight to the map.
+        cells[~cells["walkable"]] = tile_types.floor
+
+
+def carve_rooms(
+        dungeon: GameMap,
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
-        map_width: int,
-        map_height: int,
         engine: Engine,
-) -> game_map.GameMap:
-    """Generate a new dungeon map."""
-    player = engine.player
-    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[player])
+        decorate: Optional[Callable[[GameMap, RectangularRoom], None]] = None,
+) -> Tuple[int, int]:
+    """Dig out up to `max_rooms` rooms joined by tunnels, put the player in the
+    first one and populate the rest, calling `decorate` on each room.
 
-    rooms: List[RectangularRoom] = []
+    Returns the center of the last room, for the down stairs.
+    """
+    player = engine.player
+    # Every cell covered by a room so far, walls included. Testing a new room
+    # is one slice lookup rather than a comparison against every earlier room.
+    occupied = np.zeros((dungeon.width, dungeon.height), dtype=bool, order="F")
+    last_room: Optional[RectangularRoom] = None
     center_of_last_room = (0, 0)
+    # Roll the contents of every room that could be dug in one go.
+    room_contents = roll_room_contents(engine.game_world.current_floor, max_rooms)
+    rooms_dug = 0
 
     for r in range(max_rooms):
         room_width = random.randint(room_min_size, room_max_size)
@@ -195,194 +294,78 @@ def generate_dungeon(
         # "RectangularRoom" class makes rectangles easier to work with
         new_room = RectangularRoom(x, y, room_width, room_height)
 
-        # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        # See if this room overlaps any of the other rooms.
+        if occupied[new_room.outer].any():
             continue  # This room intersects, so go to the next attempt.
         # If there are no intersections then the room is valid.
+        occupied[new_room.outer] = True
 
         # Dig out this rooms inner area.
         dungeon.tiles[new_room.inner] = tile_types.floor
 
-        if len(rooms) == 0:
+        if last_room is None:
             # The first room, where the player starts.
             player.place(*new_room.center, dungeon)
         else:  # All rooms after the first.
             # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                if not dungeon.tiles[x, y][0]:
-                    dungeon.tiles[x, y] = tile_types.floor
+            carve_tunnel(dungeon, last_room.center, new_room.center)
 
             center_of_last_room = new_room.center
 
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
+        place_entities(new_room, dungeon, engine.game_world.current_floor, room_contents[rooms_dug])
+        rooms_dug += 1
 
-        # Finally, append the new room to the list.
-        rooms.append(new_room)
+        if decorate:
+            decorate(dungeon, new_room)
 
-    dungeon.remove_entities_at_location(center_of_last_room[0],center_of_last_room[1])
-    dungeon.tiles[center_of_last_room] = tile_types.down_stairs
-    dungeon.downstairs_location = center_of_last_room
-    return dungeon
+        last_room = new_room
 
+    return center_of_last_room
 
-def generate_temple(
-        max_rooms: int,
-        room_min_size: int,
-        room_max_size: int,
-        map_width: int,
-        map_height: int,
-        engine: Engine,
-) -> game_map.GameMap:
-    """Generate a new temple map."""
-    player = engine.player
-    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[player])
 
-    rooms: List[RectangularRoom] = []
-    center_of_last_room = (0, 0)
+def place_down_stairs(dungeon: GameMap, location: Tuple[int, int]) -> None:
+    dungeon.remove_entities_at_location(*location)
+    dungeon.tiles[location] = tile_types.down_stairs
+    dungeon.downstairs_location = location
 
-    for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
-
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
-
-        # "RectangularRoom" class makes rectangles easier to work with
-        new_room = RectangularRoom(x, y, room_width, room_height)
-
-        # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
-            continue  # This room intersects, so go to the next attempt.
-        # If there are no intersections then the room is valid.
-
-        # Dig out this rooms inner area.
-        dungeon.tiles[new_room.inner] = tile_types.floor
-
-        if len(rooms) == 0:
-            # The first room, where the player starts.
-            player.place(*new_room.center, dungeon)
-        else:  # All rooms after the first.
-            # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                if not dungeon.tiles[x, y][0]:
-                    dungeon.tiles[x, y] = tile_types.floor
 
-            center_of_last_room = new_room.center
+def stamp(
+        dungeon: GameMap,
+        prototype: Entity,
+        mask: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        skip_occupied: bool = False,
+) -> None:
+    """Spawn `prototype` on every cell (xs, ys) where `mask` is set.
+    With `skip_occupied`, cells that already hold an entity are left alone."""
+    for x, y in zip(xs[mask].tolist(), ys[mask].tolist()):
+        if skip_occupied and dungeon.get_entity_at_location(x, y):
+            continue
+        prototype.spawn(dungeon, x, y)
 
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
 
-        # Add some temple-themed decoration
-        n = random.random()
-        if n < 0.15:
-            # circle of candles
-            for x, y in [[-2, -1], [-1, -2], [1, -2], [2, -1], [1, 2], [2, 1], [-1, 2], [-2, 1]]:
-                n2 = random.random()
-                if n2 > 0.5:
-                    entity_factories.candles2.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-                else:
-                    entity_factories.candles.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-
-        elif n < 0.3:
-            # carpet3 + statues at each corner
-            dungeon.tiles[new_room.inner2] = tile_types.carpet3
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-        elif n < 0.45:
-            n = random.randrange(0, 4)
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0 and not dungeon.get_entity_at_location(x3, y3):
-                            entity_factories.statue.spawn(dungeon, x3, y3)
-                    else:
-                        if y3%2==0 and not dungeon.get_entity_at_location(x3, y3):
-                            entity_factories.statue.spawn(dungeon, x3, y3)
-        elif n < 0.6:
-            # carpet1
-            dungeon.tiles[new_room.inner2] = tile_types.carpet1
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-
-        elif n < 0.75:
-            # carpet2
-            dungeon.tiles[new_room.inner2] = tile_types.carpet2
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-
-        elif n < 0.9:
-            # carpet pattern
-            dungeon.tiles[new_room.inner2] = tile_types.wood_planks
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-            n = random.randrange(0,4)
-            if n==0:
-                entity_factories.lectern.spawn(dungeon, new_room.x1 + 1, new_room.center[1])
-            elif n==1:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y1 + 1)
-            elif n==2:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y2 - 1)
-            else:
-                entity_factories.lectern.spawn(dungeon, new_room.x2 - 1, new_room.center[1])
-
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
-                    else:
-                        if y3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
-            pass
-        else:
-            # chairs and lectern
-            n = random.randrange(0,4)
-            if n==0:
-                entity_factories.lectern.spawn(dungeon, new_room.x1 + 1, new_room.center[1])
-            elif n==1:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y1 + 1)
-            elif n==2:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y2 - 1)
-            else:
-                entity_factories.lectern.spawn(dungeon, new_room.x2 - 1, new_room.center[1])
+def spawn_in_corners(dungeon: GameMap, room: RectangularRoom, prototype: Entity) -> None:
+    """Most of the time, put `prototype` in each free inner corner of `room`."""
+    for x, y in [(room.x1 + 1, room.y1 + 1), (room.x1 + 1, room.y2 - 1),
+                 (room.x2 - 1, room.y1 + 1), (room.x2 - 1, room.y2 - 1)]:
+        if not dungeon.get_entity_at_location(x, y) and random.random() > 0.1:
+            prototype.spawn(dungeon, x, y)
 
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
-                    else:
-                        if y3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
 
+def spawn_lectern(dungeon: GameMap, room: RectangularRoom, side: int) -> None:
+    """Put a lectern against one of the four walls of `room`."""
+    if side == 0:
+        entity_factories.lectern.spawn(dungeon, room.x1 + 1, room.center[1])
+    elif side == 1:
+        entity_factories.lectern.spawn(dungeon, room.center[0], room.y1 + 1)
+    elif side == 2:
+        entity_factories.lectern.spawn(dungeon, room.center[0], room.y2 - 1)
+    else:
+        entity_factories.lectern.spawn(dungeon, room.x2 - 1, room.center[1])
 
-        # Finally, append the new room to the list.
-        rooms.append(new_room)
-    dungeon.remove_entities_at_location(center_of_last_room[0],center_of_last_room[1])
-    dungeon.tiles[center_of_last_room] = tile_types.down_stairs
-    dungeon.downstairs_location = center_of_last_room
 
-    return dungeon
-def generate_barracks(
+def generate_dungeon(
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
@@ -390,179 +373,156 @@ def generate_barracks(
         map_height: int,
         engine: Engine,
 ) -> game_map.GameMap:
-    """Generate a new temple map."""
-    player = engine.player
-    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[player])
+    """Generate a new dungeon map."""
+    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[engine.player])
 
-    rooms: List[RectangularRoom] = []
-    center_of_last_room = (0, 0)
+    center_of_last_room = carve_rooms(dungeon, max_rooms, room_min_size, room_max_size, engine)
 
-    for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+    place_down_stairs(dungeon, center_of_last_room)
+    repair_floor(dungeon)
+    return dungeon
 
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
 
-        # "RectangularRoom" class makes rectangles easier to work with
-        new_room = RectangularRoom(x, y, room_width, room_height)
+def decorate_temple_room(dungeon: GameMap, room: RectangularRoom) -> None:
+    """Add some temple-themed decoration."""
+    xs, ys = room.inner2_cells
+    n = random.random()
+    if n < 0.15:
+        # circle of candles
+        for x, y in [[-2, -1], [-1, -2], [1, -2], [2, -1], [1, 2], [2, 1], [-1, 2], [-2, 1]]:
+            n2 = random.random()
+            if n2 > 0.5:
+                entity_factories.candles2.spawn(dungeon, x + room.center[0], y + room.center[1])
+            else:
+                entity_factories.candles.spawn(dungeon, x + room.center[0], y + room.center[1])
+
+    elif n < 0.3:
+        # carpet3 + statues at each corner
+        dungeon.tiles[room.inner2] = tile_types.carpet3
+        spawn_in_corners(dungeon, room, entity_factories.statue)
+    elif n < 0.45:
+        # rows of pillars
+        n = random.randrange(0, 4)
+        rows = (xs if n == 0 or n == 3 else ys) % 2 == 0
+        stamp(dungeon, entity_factories.statue, rows, xs, ys, skip_occupied=True)
+    elif n < 0.6:
+        # carpet1
+        dungeon.tiles[room.inner2] = tile_types.carpet1
+        spawn_in_corners(dungeon, room, entity_factories.torch)
+    elif n < 0.75:
+        # carpet2
+        dungeon.tiles[room.inner2] = tile_types.carpet2
+        spawn_in_corners(dungeon, room, entity_factories.torch)
+    elif n < 0.9:
+        # carpet pattern, chairs and lectern
+        dungeon.tiles[room.inner2] = tile_types.wood_planks
+        spawn_in_corners(dungeon, room, entity_factories.torch)
+        n = random.randrange(0, 4)
+        spawn_lectern(dungeon, room, n)
+        rows = (xs if n == 0 or n == 3 else ys) % 2 == 0
+        stamp(dungeon, entity_factories.chair, rows, xs, ys)
+    else:
+        # chairs and lectern
+        n = random.randrange(0, 4)
+        spawn_lectern(dungeon, room, n)
+        rows = (xs if n == 0 or n == 3 else ys) % 2 == 0
+        stamp(dungeon, entity_factories.chair, rows, xs, ys)
 
-        # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
-            continue  # This room intersects, so go to the next attempt.
-        # If there are no intersections then the room is valid.
 
-        # Dig out this rooms inner area.
-        dungeon.tiles[new_room.inner] = tile_types.floor
+def generate_temple(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        engine: Engine,
+) -> game_map.GameMap:
+    """Generate a new temple map."""
+    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[engine.player])
 
-        if len(rooms) == 0:
-            # The first room, where the player starts.
-            player.place(*new_room.center, dungeon)
-        else:  # All rooms after the first.
-            # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                if not dungeon.tiles[x, y][0]:
-                    dungeon.tiles[x, y] = tile_types.floor
+    center_of_last_room = carve_rooms(
+        dungeon, max_rooms, room_min_size, room_max_size, engine, decorate_temple_room
+    )
 
-            center_of_last_room = new_room.center
+    place_down_stairs(dungeon, center_of_last_room)
+    repair_floor(dungeon)
+    return dungeon
 
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
 
-        # Add some temple-themed decoration
-        n = random.random()
-        if n < 0.15:
-            # circle of candles
-            for x, y in [[-2, -1], [-1, -2], [1, -2], [2, -1], [1, 2], [2, 1], [-1, 2], [-2, 1]]:
-                n2 = random.random()
-                if n2 > 0.5:
-                    entity_factories.chair.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-                else:
-                    entity_factories.chair.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-
-            for x, y in [[-1, -1], [1, -1], [1, 1], [-1, 1]]:
-                if not dungeon.get_entity_at_location(x + new_room.center[0], y + new_room.center[1]):
-                    entity_factories.table.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-            for x, y in [[-1, 0], [1, 0], [0, 1], [0, -1]]:
-                if not dungeon.get_entity_at_location(x + new_room.center[0], y + new_room.center[1]):
-                    entity_factories.cabinet.spawn(dungeon, x + new_room.center[0], y + new_room.center[1])
-
-            if not dungeon.get_entity_at_location(x + new_room.center[0], y + new_room.center[1]):
-                entity_factories.brazier.spawn(dungeon, new_room.center[0], new_room.center[1])
-        elif n < 0.3:
-            # carpet3 + statues at each corner
-            dungeon.tiles[new_room.inner] = tile_types.wood_planks
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.statue.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0:
-                            if x3%4==0 and not dungeon.get_entity_at_location(x3, y3):
-                                entity_factories.shelf.spawn(dungeon, x3, y3)
-                            else:
-                                entity_factories.barrel.spawn(dungeon, x3, y3)
-
-                    else:
-                        if y3%2==0:
-                            if y3%4==0 and not dungeon.get_entity_at_location(x3, y3):
-                                entity_factories.shelf.spawn(dungeon, x3, y3)
-                            else:
-                                entity_factories.barrel.spawn(dungeon, x3, y3)
-        elif n < 0.45:
-            n = random.randrange(0, 4)
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%4==0:
-                            entity_factories.bed.spawn(dungeon, x3, y3)
-                        elif (x3+1)%4==0:
-                            entity_factories.cabinet.spawn(dungeon, x3, y3)
-
-                    else:
-                        if y3%4==0:
-                            entity_factories.bed.spawn(dungeon, x3, y3)
-                        elif (y3+1)%4==0:
-                            entity_factories.cabinet.spawn(dungeon, x3, y3)
-        elif n < 0.6:
-            # carpet1
-            dungeon.tiles[new_room.inner] = tile_types.wood_planks
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-
-
-
-        elif n < 0.75:
-            dungeon.tiles[new_room.inner] = tile_types.wood_planks
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x1 + 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x1 + 1, new_room.y2 - 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y1 + 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y1 + 1)
-            if not dungeon.get_entity_at_location(new_room.x2 - 1, new_room.y2 - 1) and \
-                    random.random() > 0.1: entity_factories.torch.spawn(dungeon, new_room.x2 - 1, new_room.y2 - 1)
-
-        elif n < 0.9:
-            dungeon.tiles[new_room.inner] = tile_types.wood_planks
-
-            n = random.randrange(0, 4)
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0:
-                            if y3%2==0:
-                                entity_factories.bed.spawn(dungeon, x3, y3)
-                            else:
-                                entity_factories.cabinet.spawn(dungeon, x3, y3)
-
-                    else:
-                        if y3%2==0:
-                            if x3%2==0:
-                                entity_factories.bed.spawn(dungeon, x3, y3)
-                            else:
-                                entity_factories.cabinet.spawn(dungeon, x3, y3)
-            pass
-        else:
-            # chairs and lectern
-            n = random.randrange(0,4)
-            if n==0:
-                entity_factories.lectern.spawn(dungeon, new_room.x1 + 1, new_room.center[1])
-            elif n==1:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y1 + 1)
-            elif n==2:
-                entity_factories.lectern.spawn(dungeon, new_room.center[0], new_room.y2 - 1)
-            else:
-                entity_factories.lectern.spawn(dungeon, new_room.x2 - 1, new_room.center[1])
+def decorate_barracks_room(dungeon: GameMap, room: RectangularRoom) -> None:
+    """Add some barracks-themed furniture."""
+    xs, ys = room.inner2_cells
+    n = random.random()
+    if n < 0.15:
+        # chairs around a table
+        for x, y in [[-2, -1], [-1, -2], [1, -2], [2, -1], [1, 2], [2, 1], [-1, 2], [-2, 1]]:
+            entity_factories.chair.spawn(dungeon, x + room.center[0], y + room.center[1])
+
+        for x, y in [[-1, -1], [1, -1], [1, 1], [-1, 1]]:
+            if not dungeon.get_entity_at_location(x + room.center[0], y + room.center[1]):
+                entity_factories.table.spawn(dungeon, x + room.center[0], y + room.center[1])
+        for x, y in [[-1, 0], [1, 0], [0, 1], [0, -1]]:
+            if not dungeon.get_entity_at_location(x + room.center[0], y + room.center[1]):
+                entity_factories.cabinet.spawn(dungeon, x + room.center[0], y + room.center[1])
+
+        if not dungeon.get_entity_at_location(x + room.center[0], y + room.center[1]):
+            entity_factories.brazier.spawn(dungeon, room.center[0], room.center[1])
+    elif n < 0.3:
+        # storeroom: statues at each corner, rows of shelves and barrels
+        dungeon.tiles[room.inner] = tile_types.wood_planks
+        spawn_in_corners(dungeon, room, entity_factories.statue)
+
+        lines = xs if n == 0 or n == 3 else ys
+        rows = lines % 2 == 0
+        stamp(dungeon, entity_factories.shelf, rows & (lines % 4 == 0), xs, ys, skip_occupied=True)
+        stamp(dungeon, entity_factories.barrel, rows & (lines % 4 != 0), xs, ys)
+    elif n < 0.45:
+        # dormitory
+        n = random.randrange(0, 4)
+        lines = xs if n == 0 or n == 3 else ys
+        stamp(dungeon, entity_factories.bed, lines % 4 == 0, xs, ys)
+        stamp(dungeon, entity_factories.cabinet, (lines + 1) % 4 == 0, xs, ys)
+    elif n < 0.75:
+        # wooden floor with torches
+        dungeon.tiles[room.inner] = tile_types.wood_planks
+        spawn_in_corners(dungeon, room, entity_factories.torch)
+    elif n < 0.9:
+        # beds, each with a cabinet beside it
+        dungeon.tiles[room.inner] = tile_types.wood_planks
+
+        n = random.randrange(0, 4)
+        along, across = (xs, ys) if n == 0 or n == 3 else (ys, xs)
+        rows = along % 2 == 0
+        stamp(dungeon, entity_factories.bed, rows & (across % 2 == 0), xs, ys)
+        stamp(dungeon, entity_factories.cabinet, rows & (across % 2 != 0), xs, ys)
+    else:
+        # chairs and lectern
+        n = random.randrange(0, 4)
+        spawn_lectern(dungeon, room, n)
+        rows = (xs if n == 0 or n == 3 else ys) % 2 == 0
+        stamp(dungeon, entity_factories.chair, rows, xs, ys)
 
-            for x3 in range(new_room.x1+2,new_room.x2-1):
-                for y3 in range(new_room.y1+2,new_room.y2-1):
-                    if n==0 or n==3:
-                        if x3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
-                    else:
-                        if y3%2==0:entity_factories.chair.spawn(dungeon, x3, y3)
 
+def generate_barracks(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        engine: Engine,
+) -> game_map.GameMap:
+    """Generate a new barracks map."""
+    dungeon = game_map.GameMap(engine, map_width, map_height, entities=[engine.player])
 
-        # Finally, append the new room to the list.
-        rooms.append(new_room)
-    dungeon.remove_entities_at_location(center_of_last_room[0],center_of_last_room[1])
-    dungeon.tiles[center_of_last_room] = tile_types.down_stairs
-    dungeon.downstairs_location = center_of_last_room
+    center_of_last_room = carve_rooms(
+        dungeon, max_rooms, room_min_size, room_max_size, engine, decorate_barracks_room
+    )
 
+    place_down_stairs(dungeon, center_of_last_room)
+    repair_floor(dungeon)
     return dungeon
 
+
 def generate_cave(
         map_width: int,
         map_height: int,
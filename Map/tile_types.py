@@ -136,4 +136,25 @@ down_stairs = new_tile(
     transparent=True,
     dark=(ord(">"), (0, 0, 100), (50, 50, 120)),
     light=(ord(">"), (255, 255, 255), (55, 50, 45)),
-)
\ No newline at end of file
+)
+
+up_stairs = new_tile(
+    walkable=True,
+    transparent=True,
+    dark=(ord("<"), (0, 0, 100), (50, 50, 120)),
+    light=(ord("<"), (255, 255, 255), (55, 50, 45)),
+)
+
+# Every tile type by name, so maps can be stored as one byte per cell.
+TILE_NAMES = sorted(
+    name for name, value in list(globals().items())
+    if isinstance(value, np.ndarray) and value.dtype == tile_dt and value.shape == ()
+)
+
+
+def encode_tiles(tiles: np.ndarray) -> np.ndarray:
+    """Return the index into TILE_NAMES of every tile, 255 for unknown tiles."""
+    ids = np.full(tiles.shape, 255, dtype=np.uint8, order="F")
+    for index, name in enumerate(TILE_NAMES):
+        ids[tiles == globals()[name]] = index
+    return ids
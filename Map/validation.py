@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import List, Tuple, TYPE_CHECKING
+
+import numpy as np  # type: ignore
+import scipy.ndimage  # type: ignore
+import tcod
+
+from Entities.entity import Actor
+from Map import tile_types
+
+if TYPE_CHECKING:
+    from Map.game_map import GameMap
+
+UNREACHABLE = np.iinfo(np.int32).max
+EIGHT_WAY = np.ones((3, 3), dtype=bool)
+
+
+class FloorReport:
+    """What `validate_floor` found out about a floor."""
+
+    def __init__(self):
+        self.stairs_reachable = False
+        self.critical_path = -1  # Steps from the player start to the stairs.
+        self.pockets = 0  # Open areas that can't be reached from the start.
+        self.pocket_cells = 0
+        self.unreachable_spawns = 0
+        self.repaired_pockets = 0
+        self.rejected = 0  # Candidate maps the generator threw away before this one.
+
+    @property
+    def ok(self) -> bool:
+        return self.stairs_reachable and not self.unreachable_spawns
+
+    def __repr__(self) -> str:
+        return (
+            f"FloorReport(stairs_reachable={self.stairs_reachable}, critical_path={self.critical_path}, "
+            f"pockets={self.pockets}, pocket_cells={self.pocket_cells}, "
+            f"unreachable_spawns={self.unreachable_spawns}, repaired_pockets={self.repaired_pockets}, "
+            f"rejected={self.rejected})"
+        )
+
+
+def open_cells(dungeon: GameMap) -> np.ndarray:
+    """Walkable cells not taken up by furniture. Actors move, so only blocking
+    entities on cells without an actor count as furniture."""
+    return dungeon.tiles["walkable"] & ~(dungeon.blocked & (dungeon.actor_count == 0))
+
+
+def _analyse(dungeon: GameMap) -> Tuple[FloorReport, np.ndarray, np.ndarray]:
+    """Return the report, the component labels and the walking distance from
+    the player start."""
+    report = FloorReport()
+    player = dungeon.engine.player
+    start = (player.x, player.y)
+    passable = open_cells(dungeon)
+    passable[start] = True
+
+    labels, count = scipy.ndimage.label(passable, structure=EIGHT_WAY)
+    distance = np.full(passable.shape, UNREACHABLE, dtype=np.int32, order="F")
+    distance[start] = 0
+    tcod.path.dijkstra2d(distance, passable.astype(np.int8), 1, 1)
+
+    stairs = dungeon.downstairs_location
+    report.stairs_reachable = bool(distance[stairs] != UNREACHABLE)
+    if report.stairs_reachable:
+        report.critical_path = int(distance[stairs])
+
+    main = labels[start]
+    sizes = np.bincount(labels.ravel(), minlength=count + 1)
+    report.pockets = count - 1
+    report.pocket_cells = int(sizes[1:].sum() - sizes[main])
+
+    # Something standing on a blocked cell counts as reachable when any of the
+    # cells next to it is.
+    reachable = scipy.ndimage.binary_dilation(distance != UNREACHABLE, structure=EIGHT_WAY)
+    report.unreachable_spawns = sum(
+        1 for entity in dungeon.entities
+        if (isinstance(entity, Actor) or not entity.blocks_movement) and not reachable[entity.x, entity.y]
+    )
+    return report, labels, distance
+
+
+def validate_floor(dungeon: GameMap) -> FloorReport:
+    """Check that the stairs and everything spawned can be reached from the
+    player start, and count the open areas that can't."""
+    return _analyse(dungeon)[0]
+
+
+def repair_floor(dungeon: GameMap) -> FloorReport:
+    """Validate `dungeon` and connect every unreachable pocket to the rest of
+    the floor by a straight passage, clearing walls and furniture in the way.
+
+    The final report is stored as `dungeon.generation_report` and returned.
+    """
+    report, labels, distance = _analyse(dungeon)
+    if report.ok and not report.pockets:
+        dungeon.generation_report = report
+        return report
+
+    main = labels[dungeon.engine.player.x, dungeon.engine.player.y]
+    # For every cell, the nearest cell of the part of the map the player is in.
+    gap, nearest = scipy.ndimage.distance_transform_edt(labels != main, return_indices=True)
+    repaired = 0
+    for pocket in range(1, labels.max() + 1):
+        if pocket == main:
+            continue
+        cells = np.flatnonzero((labels == pocket).ravel(order="F"))
+        if not len(cells):
+            continue
+        closest = cells[np.argmin(gap.ravel(order="F")[cells])]
+        x, y = np.unravel_index(closest, labels.shape, order="F")
+        target = (int(nearest[0][x, y]), int(nearest[1][x, y]))
+        _clear_passage(dungeon, tcod.los.bresenham((int(x), int(y)), target).tolist())
+        repaired += 1
+
+    if repaired:
+        dungeon.tiles_changed()
+    report = validate_floor(dungeon)
+    report.repaired_pockets = repaired
+    dungeon.generation_report = report
+    return report
+
+
+def _clear_passage(dungeon: GameMap, cells: List[List[int]]) -> None:
+    for x, y in cells:
+        if not dungeon.tiles["walkable"][x, y]:
+            dungeon.tiles[x, y] = tile_types.floor
+        blocker = dungeon.get_blocking_entity_at_location(x, y)
+        while blocker is not None and not isinstance(blocker, Actor):
+            dungeon.remove_entity(blocker)
+            blocker = dungeon.get_blocking_entity_at_location(x, y)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from Map.game_map import GameMap
+
+# The part of the console the map is drawn on, the rest is the UI.
+VIEW_WIDTH = 80
+VIEW_HEIGHT = 43
+
+
+class Camera:
+    """
+    The window of the map that is drawn, kept centred on the player.
+
+    (x, y) is the map position of the top left corner of the view. Maps
+    smaller than the view are drawn from the corner of the console as before.
+    """
+
+    def __init__(self, width: int = VIEW_WIDTH, height: int = VIEW_HEIGHT):
+        self.width = width
+        self.height = height
+        self.x = 0
+        self.y = 0
+        self.map_width = width
+        self.map_height = height
+
+    def follow(self, game_map: GameMap, x: int, y: int) -> None:
+        """Centre the view on (x, y), without showing anything past the map edges."""
+        self.map_width, self.map_height = game_map.width, game_map.height
+        self.x = max(0, min(x - self.width // 2, game_map.width - self.width))
+        self.y = max(0, min(y - self.height // 2, game_map.height - self.height))
+
+    @property
+    def view_width(self) -> int:
+        return min(self.width, self.map_width)
+
+    @property
+    def view_height(self) -> int:
+        return min(self.height, self.map_height)
+
+    @property
+    def slices(self) -> Tuple[slice, slice]:
+        """The map area in view, for indexing map arrays."""
+        return slice(self.x, self.x + self.view_width), slice(self.y, self.y + self.view_height)
+
+    def in_view(self, x: int, y: int) -> bool:
+        return self.x <= x < self.x + self.view_width and self.y <= y < self.y + self.view_height
+
+    def map_to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        return x - self.x, y - self.y
+
+    def screen_to_map(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """The map position under console tile (x, y), or None if the map isn't drawn there."""
+        if not (0 <= x < self.view_width and 0 <= y < self.view_height):
+            return None
+        return x + self.x, y + self.y
+
+    def clamp(self, x: int, y: int) -> Tuple[int, int]:
+        """The closest map position to (x, y) that is in view."""
+        return (
+            max(self.x, min(x, self.x + self.view_width - 1)),
+            max(self.y, min(y, self.y + self.view_height - 1)),
+        )
@@ -1,17 +1,73 @@
-from typing import List, Reversible, Tuple, Iterable
+from collections import OrderedDict, deque
+from array import array
+from bisect import bisect_right
+from typing import Any, Deque, Dict, Iterator, List, Optional, Reversible, Tuple, Iterable
+import os
+import shutil
 import textwrap
+import uuid
 
 import tcod
 
 import UI.color
 from UI import color
 
+# Text for the messages that are logged often enough that building the string
+# up front would be wasted work. Messages are stored as a template id plus the
+# arguments and only formatted when something actually needs the text.
+MESSAGE_TEMPLATES: Dict[str, str] = {
+    "melee_hit_you": "{attacker} attacks you for {damage} hit points.",
+    "melee_hit": "{attacker} attacks the {target} for {damage} hit points.",
+    "melee_miss_you": "{attacker} attacks you but does no damage.",
+    "melee_miss": "{attacker} attacks the {target} but does no damage.",
+    "melee_dodge_you": "You dodge an incoming attack from the {attacker}",
+    "melee_dodge": "The {target} dodges an attack from the {attacker}",
+    "melee_block_you": "You block the attack from the {attacker} but take {taken}({damage})",
+    "melee_block": "The {target} blocks the attack from the {attacker} but takes {taken}({damage})",
+    "loses_nerve": "The {name} loses its nerve in battle and runs for its life from the {source}!",
+    "dead": "{name} is dead!",
+    "gain_xp": "You gain {xp} experience points.",
+    "frost_tick_you": "You take {damage} damage from unnatural cold",
+    "frost_tick": "{name} takes {damage} damage from unnatural cold",
+    "maw_tick": "{damage} lifeforce is sucked out of {name} and into the maw",
+}
+
+# Each log archives to its own file in here, named after its archive token.
+ARCHIVE_DIRECTORY = "log_archive"
+# How many archived messages are read from disk at once when paging.
+ARCHIVE_PAGE_SIZE = 64
+ARCHIVE_PAGE_CACHE = 16
+
 
 class Message:
-    def __init__(self, text: str, fg: Tuple[int, int, int]):
-        self.plain_text = text
+    def __init__(
+        self,
+        text: str,
+        fg: Tuple[int, int, int],
+        args: Optional[Dict[str, Any]] = None,
+        turn: int = 0,
+    ):
+        """`text` is either the message itself or, when `args` is given, a key
+        into MESSAGE_TEMPLATES."""
+        self.template = text
+        self.args = args
         self.fg = fg
+        self.turn = turn
         self.count = 1
+        self._text: Optional[str] = None if args is not None else text
+        self._wrapped: Optional[Tuple[int, int, List[str]]] = None  # (width, count, lines)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_wrapped"] = None
+        return state
+
+    @property
+    def plain_text(self) -> str:
+        """The text of this message, formatted the first time it is needed."""
+        if self._text is None:
+            self._text = MESSAGE_TEMPLATES[self.template].format(**self.args)
+        return self._text
 
     @property
     def full_text(self) -> str:
@@ -20,10 +76,102 @@ class Message:
             return f"{self.plain_text} (x{self.count})"
         return self.plain_text
 
+    def wrapped(self, width: int) -> List[str]:
+        """The lines of this message wrapped to `width`, cached until the
+        width or the stack count changes."""
+        cached = self._wrapped
+        if cached is None or cached[0] != width or cached[1] != self.count:
+            text = self.full_text
+            if len(text) <= width and text.isprintable() and text.strip() == text:
+                lines = [text] if text else []  # Fits on one line, skip textwrap.
+            else:
+                lines = list(MessageLog.wrap(text, width))
+            cached = self._wrapped = (width, self.count, lines)
+        return cached[2]
+
 
 class MessageLog:
-    def __init__(self) -> None:
-        self.messages: List[Message] = []
+    def __init__(
+        self,
+        capacity: int = 1000,
+        archive_directory: Optional[str] = ARCHIVE_DIRECTORY,
+        formatting: bool = True,
+    ) -> None:
+        """Keep the latest `capacity` messages in memory.
+
+        Older messages are formatted and appended to this log's own file in
+        `archive_directory`, where the history viewer can page them back in.
+        With `formatting` off (headless runs) nothing is ever formatted and
+        spilled messages are simply dropped.
+        """
+        self.capacity = capacity
+        self.formatting = formatting
+        self.turn = 0
+        self.messages: Deque[Message] = deque()
+        self.archive_directory = archive_directory if formatting else None
+        self.archive_path: Optional[str] = None
+        self.archive_token = ""
+        self._archive_offsets = array("Q")  # File offset where each archived message starts.
+        self._archive_colors = array("L")  # Packed rgb of each archived message.
+        self._archive_end = 0
+        self._archive_pages: "OrderedDict[int, List[Message]]" = OrderedDict()
+        # _line_prefix[i] is the number of wrapped lines in messages [0, i) at
+        # _line_width. The last message is left out since its count can change.
+        self._line_width = 0
+        self._line_prefix = array("Q", [0])
+        if self.archive_directory:
+            self._new_archive()
+
+    def _new_archive(self) -> None:
+        """Start a fresh archive file under a new token, forgetting whatever
+        was archived before."""
+        self.archive_token = uuid.uuid4().hex
+        self.archive_path = os.path.join(self.archive_directory, f"{self.archive_token}.txt")
+        os.makedirs(self.archive_directory, exist_ok=True)
+        header = f"{self.archive_token}\n".encode()
+        with open(self.archive_path, "wb") as f:
+            f.write(header)
+        self._archive_end = len(header)
+        self._archive_offsets = array("Q")
+        self._archive_colors = array("L")
+        self._archive_pages.clear()
+        self._line_width = 0
+        self._line_prefix = array("Q", [0])
+
+    def remove_archive(self) -> None:
+        """Delete this log's archive file, e.g. along with a finished game's save."""
+        if self.archive_path and os.path.exists(self.archive_path):
+            os.remove(self.archive_path)
+
+    def remove_other_archives(self) -> None:
+        """Delete the archives of every other log. Only one game is saved at a
+        time, so once it is saved the others belong to nothing."""
+        if not self.archive_directory or not os.path.isdir(self.archive_directory):
+            return
+        for name in os.listdir(self.archive_directory):
+            if name != f"{self.archive_token}.txt":
+                os.remove(os.path.join(self.archive_directory, name))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_archive_pages"] = OrderedDict()
+        state["_line_width"] = 0
+        state["_line_prefix"] = array("Q", [0])
+        return state
+
+    def __len__(self) -> int:
+        return len(self._archive_offsets) + len(self.messages)
+
+    def __getitem__(self, index: int) -> Message:
+        """Return the message at `index`, reading it from the archive if it
+        is no longer held in memory."""
+        if index < 0:
+            index += len(self)
+        archived = len(self._archive_offsets)
+        if index < archived:
+            page = self._archive_page(index // ARCHIVE_PAGE_SIZE)
+            return page[index % ARCHIVE_PAGE_SIZE]
+        return self.messages[index - archived]
 
     def add_message(
         self, text: str, fg: Tuple[int, int, int] = color.white, *, stack: bool = True,
@@ -33,10 +181,132 @@ class MessageLog:
         If `stack` is True then the message can stack with a previous message
         of the same text.
         """
-        if stack and self.messages and text == self.messages[-1].plain_text:
-            self.messages[-1].count += 1
+        self._add(text, None, fg, stack)
+
+    def add_template(
+        self, template: str, fg: Tuple[int, int, int] = color.white, *, stack: bool = True, **args: Any
+    ) -> None:
+        """Add a message built from MESSAGE_TEMPLATES[`template`] and `args`.
+        The text is not formatted until the message is drawn or saved.
+        """
+        self._add(template, args, fg, stack)
+
+    def _add(
+        self, template: str, args: Optional[Dict[str, Any]], fg: Tuple[int, int, int], stack: bool
+    ) -> None:
+        if stack and self.messages:
+            last = self.messages[-1]
+            if last.template == template and last.args == args:
+                last.count += 1
+                return
+        self.messages.append(Message(template, fg, args, self.turn))
+        if len(self.messages) > self.capacity + max(1, self.capacity // 4):
+            self._spill(len(self.messages) - self.capacity)
+
+    def _spill(self, count: int) -> None:
+        """Move the oldest `count` messages out of memory and into the archive."""
+        spilled = [self.messages.popleft() for _ in range(count)]
+        if not self.archive_directory:
+            return
+        if not self._archive_valid() or os.path.getsize(self.archive_path) != self._archive_end:
+            # The file was deleted or is another log's, don't write into it.
+            self._new_archive()
+        # The last page may have been cached while it was only partly filled.
+        self._archive_pages.pop(len(self._archive_offsets) // ARCHIVE_PAGE_SIZE, None)
+        chunks = []
+        for message in spilled:
+            data = (message.full_text + "\n").encode()
+            self._archive_offsets.append(self._archive_end)
+            r, g, b = message.fg
+            self._archive_colors.append((r << 16) | (g << 8) | b)
+            self._archive_end += len(data)
+            chunks.append(data)
+        with open(self.archive_path, "ab") as f:
+            f.write(b"".join(chunks))
+
+    def _archive_valid(self) -> bool:
+        """True if the archive file on disk still belongs to this log."""
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return False
+        with open(self.archive_path, "rb") as f:
+            return f.readline().decode().strip() == self.archive_token
+
+    def _archive_page(self, page_index: int) -> List[Message]:
+        """Return one page of archived messages, reading it from disk if it
+        is not cached."""
+        page = self._archive_pages.get(page_index)
+        if page is not None:
+            self._archive_pages.move_to_end(page_index)
+            return page
+
+        start = page_index * ARCHIVE_PAGE_SIZE
+        stop = min(start + ARCHIVE_PAGE_SIZE, len(self._archive_offsets))
+        page = []
+        if self._archive_valid():
+            begin = self._archive_offsets[start]
+            end = self._archive_offsets[stop] if stop < len(self._archive_offsets) else self._archive_end
+            with open(self.archive_path, "rb") as f:
+                f.seek(begin)
+                data = f.read(end - begin)
+            for i in range(start, stop):
+                text = data[self._archive_offsets[i] - begin:
+                            (self._archive_offsets[i + 1] if i + 1 < stop else end) - begin]
+                packed = self._archive_colors[i]
+                fg = ((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF)
+                page.append(Message(text.decode().rstrip("\n"), fg))
         else:
-            self.messages.append(Message(text, fg))
+            page = [Message("(archived message unavailable)", color.impossible)] * (stop - start)
+
+        self._archive_pages[page_index] = page
+        if len(self._archive_pages) > ARCHIVE_PAGE_CACHE:
+            self._archive_pages.popitem(last=False)
+        return page
+
+    def iter_back(self, stop: int) -> Iterator[Message]:
+        """Yield messages from `stop - 1` back towards the start of the log."""
+        archived = len(self._archive_offsets)
+        for index in range(stop - 1, -1, -1):
+            if index >= archived:
+                yield self.messages[index - archived]
+            else:
+                yield self[index]
+
+    def _sync_line_index(self, width: int) -> None:
+        """Extend the line index to cover every message but the last."""
+        if width != self._line_width:
+            self._line_width = width
+            self._line_prefix = array("Q", [0])
+        prefix = self._line_prefix
+        for index in range(len(prefix) - 1, len(self) - 1):
+            prefix.append(prefix[-1] + len(self[index].wrapped(width)))
+
+    def line_count(self, width: int) -> int:
+        """The number of lines the whole log takes up when wrapped to `width`."""
+        if not len(self):
+            return 0
+        self._sync_line_index(width)
+        return self._line_prefix[-1] + len(self[-1].wrapped(width))
+
+    def locate_line(self, line: int, width: int) -> Tuple[int, int]:
+        """Return the message index holding wrapped line `line`, and the
+        line's position inside that message."""
+        self._sync_line_index(width)
+        prefix = self._line_prefix
+        if line >= prefix[-1]:
+            index = len(prefix) - 1
+        else:
+            index = bisect_right(prefix, line) - 1
+        return index, line - prefix[index]
+
+    def save(self, filename: str) -> None:
+        """Write the whole log, archived messages included, to `filename`."""
+        with open(filename, "wb") as f:
+            if self._archive_offsets and self._archive_valid():
+                with open(self.archive_path, "rb") as archive:
+                    archive.seek(self._archive_offsets[0])
+                    shutil.copyfileobj(archive, f)
+            for message in self.messages:
+                f.write((message.full_text + "\n").encode())
 
     def render(
         self, console: tcod.Console, x: int, y: int, width: int, height: int,
@@ -47,6 +317,23 @@ class MessageLog:
         """
         self.render_messages(console, x, y, width, height, self.messages)
 
+    def render_history(
+        self, console: tcod.Console, x: int, y: int, width: int, height: int, line: int,
+    ) -> None:
+        """Render the log with wrapped line `line` at the bottom of the area,
+        paging in archived messages as they are reached."""
+        if not len(self):
+            return
+        index, offset = self.locate_line(line, width)
+        message = self[index]
+        y_offset = height - 1
+        for text in reversed(message.wrapped(width)[: offset + 1]):
+            console.print(x=x, y=y + y_offset, string=text, fg=message.fg)
+            y_offset -= 1
+            if y_offset < 0:
+                return
+        self.render_backwards(console, x, y, width, y_offset + 1, self.iter_back(index))
+
     @staticmethod
     def wrap(string: str, width: int) -> Iterable[str]:
         """Return a wrapped text message."""
@@ -69,11 +356,26 @@ class MessageLog:
         The `messages` are rendered starting at the last message and working
         backwards.
         """
+        cls.render_backwards(console, x, y, width, height, reversed(messages))
+
+    @classmethod
+    def render_backwards(
+        cls,
+        console: tcod.Console,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        messages: Iterable[Message],
+    ) -> None:
+        """Render `messages`, newest first, from the bottom of the area up."""
         y_offset = height - 1
+        if y_offset < 0:
+            return
 
-        for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text, width))):
+        for message in messages:
+            for line in reversed(message.wrapped(width)):
                 console.print(x=x, y=y + y_offset, string=line, fg=message.fg)
                 y_offset -= 1
                 if y_offset < 0:
-                    return  # No more space to print messages.
\ No newline at end of file
+                    return  # No more space to print messages.
@@ -12,6 +12,11 @@ if TYPE_CHECKING:
     from Entities.Components.skill import Skill
     from Entities.Components.fighter import Reason
 
+# How many steps away monsters can hear noisy actions, see GameMap.emit_noise.
+MELEE_NOISE = 8
+CHARGE_NOISE = 10
+FIREBALL_NOISE = 16
+
 
 class Action:
     def __init__(self, entity: Actor) -> None:
@@ -51,7 +56,7 @@ class PickupAction(Action):
                 if len(inventory.items) >= inventory.capacity:
                     raise exceptions.Impossible("Your inventory is full.")
 
-                self.engine.game_map.entities.remove(item)
+                self.engine.game_map.remove_entity(item)
                 item.parent = self.entity.inventory
                 inventory.items.append(item)
 
@@ -130,7 +135,7 @@ class TakeStairsAction(Action):
         Take the stairs, if any exist at the entity's location.
         """
         if (self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
+            self.engine.game_world.descend()
             if self.engine.game_world.current_floor == 1:
                 self.engine.message_log.add_message(
                     "You climb down the stone steps, wondering what horrors await you below", color.descend
@@ -139,6 +144,16 @@ class TakeStairsAction(Action):
                 self.engine.message_log.add_message(
                     "You descend the staircase deeper into the frozen heart of the mountain.", color.descend
                 )
+        elif (self.entity.x, self.entity.y) == self.engine.game_map.upstairs_location:
+            self.engine.game_world.ascend()
+            if self.engine.game_world.current_floor == 0:
+                self.engine.message_log.add_message(
+                    "You climb back out into the cold night air.", color.descend
+                )
+            else:
+                self.engine.message_log.add_message(
+                    "You climb the staircase back towards the surface.", color.descend
+                )
         else:
             raise exceptions.Impossible("There are no stairs here.")
 
@@ -186,11 +201,11 @@ class MeleeAction(ActionWithDirection):
         else:
             damage = self.entity.fighter.power - target.fighter.defense
 
-        attack_desc = ""
-        if (target.name == "Player"):
-            attack_desc = f"{self.entity.name.capitalize()} attacks you"
-        else:
-            attack_desc = f"{self.entity.name.capitalize()} attacks the {target.name.capitalize()}"
+        # Pick the "you" form of each message when the player is the target.
+        suffix = "_you" if target.name == "Player" else ""
+        attacker = self.entity.name.capitalize()
+        target_name = target.name.capitalize()
+        message_log = self.engine.message_log
 
         if self.entity is self.engine.player:
             attack_color = color.player_atk
@@ -204,34 +219,26 @@ class MeleeAction(ActionWithDirection):
             if not reason==Reason.NONE:
                 if reason==Reason.DODGED:
                     target.fighter.Dodge()
-                    if (target.name == "Player"):
-                        self.engine.message_log.add_message(
-                            f"You dodge an incoming attack from the {self.entity.name.capitalize()}", attack_color
-                        )
-                    else:
-                        self.engine.message_log.add_message(
-                            f"The {target.name.capitalize()} dodges an attack from the {self.entity.name.capitalize()}", attack_color
-                        )
+                    message_log.add_template(
+                        "melee_dodge" + suffix, attack_color, attacker=attacker, target=target_name
+                    )
                 elif reason==Reason.BLOCKED:
-                    if (target.name == "Player"):
-                        self.engine.message_log.add_message(
-                            f"You block the attack from the {self.entity.name.capitalize()} but take {result[0]}({int(damage)})", attack_color
-                        )
-                    else:
-                        self.engine.message_log.add_message(
-                            f"The {target.name.capitalize()} blocks the attack from the {self.entity.name.capitalize()} but takes {result[0]}({int(damage)})", attack_color
-                        )
+                    message_log.add_template(
+                        "melee_block" + suffix, attack_color,
+                        attacker=attacker, target=target_name, taken=result[0], damage=int(damage)
+                    )
             else:
                 damage=result[0]
-                self.engine.message_log.add_message(
-                    f"{attack_desc} for {int(damage)} hit points.", attack_color
+                message_log.add_template(
+                    "melee_hit" + suffix, attack_color, attacker=attacker, target=target_name, damage=int(damage)
                 )
         else:
-            self.engine.message_log.add_message(
-                f"{attack_desc} but does no damage.", attack_color
+            message_log.add_template(
+                "melee_miss" + suffix, attack_color, attacker=attacker, target=target_name
             )
         for effect in self.entity.status_effects:
             effect.on_deal_damage(target,int(damage))
+        self.engine.game_map.emit_noise(self.entity.x, self.entity.y, MELEE_NOISE)
 
 
 class MovementAction(ActionWithDirection):
@@ -244,7 +251,7 @@ class MovementAction(ActionWithDirection):
         if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
             # Destination is out of bounds.
             raise exceptions.Impossible("That way is blocked.")
-        if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
+        if self.engine.game_map.blocked[dest_x, dest_y]:
             # Destination is out of bounds.
             raise exceptions.Impossible("That way is blocked.")
         tile_entities=self.engine.game_map.get_entities_at_location(dest_x, dest_y)
@@ -409,6 +416,4 @@ class TeleportAction(Action):
 
     def perform(self) -> None:
         """Invoke the items ability, this action will be given to provide context."""
-        self.entity.x = self.target_xy[0]
-        self.entity.x = self.target_xy[1]
         self.entity.place(self.target_xy[0], self.target_xy[1], self.entity.gamemap)
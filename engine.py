@@ -6,7 +6,7 @@ import subprocess
 import threading
 import multiprocessing
 import random
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, List, Optional
 
 import pygame
 from pygame import mixer, time
@@ -14,7 +14,9 @@ from tcod.console import Console
 from tcod.map import compute_fov
 import exceptions
 from Map import tile_types
+from Map.influence_maps import InfluenceMaps
 from UI import render_functions, color
+from UI.camera import Camera
 
 from UI.message_log import MessageLog
 from easing_functions import *
@@ -23,9 +25,12 @@ from config import Config
 
 if TYPE_CHECKING:
     from Entities.entity import Actor
+    from Map.crowd_movement import CrowdMovement
     from Map.game_map import GameMap, GameWorld
     from Entities.Components.skill import Skill, SKILLS_LIST
 current_volume=0
+FOV_RADIUS = 12
+FOV_CACHE_SIZE = 8  # Recent FOV results kept per map.
 def fadeinthread(max_volume,config_volume):
     global current_volume
     #config_volume = self.config.values["MasterVolume"] * self.config.values["MusicVolume"]
@@ -45,15 +50,23 @@ class Engine:
     game_map: GameMap
     game_world: GameWorld
 
-    def __init__(self, player: Actor, config: Config):
+    def __init__(self, player: Actor, config: Config, headless: bool = False):
         from Entities.Components.skill import SKILLS_LIST
         self.pending_popup = False
         self.popup_textcolor = None
         self.popuptitle = None
         self.popuptext = None
         self.popup_side_offset = 0
-        self.message_log = MessageLog()
-        self.mouse_location = (0, 0)
+        self.headless = headless
+        self.turn = 0
+        self.influence_maps = InfluenceMaps(self)
+        self.crowd_movement: Optional[CrowdMovement] = None  # Set during the enemy turns.
+        if headless:
+            self.message_log = MessageLog(archive_directory=None, formatting=False)
+        else:
+            self.message_log = MessageLog()
+        self.mouse_location = (0, 0)  # Map position under the mouse or cursor.
+        self.camera = Camera()
         self.player = player
         self.player.skill_points = 0
         self.story_message = ""
@@ -63,12 +76,15 @@ class Engine:
         self.skills_list: List[Skill] = SKILLS_LIST
         self.boss: Actor = None
         self.hasBoss=False
-        mixer.init()
+        if not headless:
+            mixer.init()
 
         self.play_song("viking1.mp3")
 
     # play the song and fade in the song to the max_volume
     def play_song(self, song_file):
+        if self.headless:
+            return
         print("Song starting: " + song_file)
         mixer.music.load(song_file)
         mixer.music.play(-1)
@@ -84,11 +100,10 @@ class Engine:
         save_data = lzma.compress(pickle.dumps(self))
         with open(filename, "wb") as f:
             f.write(save_data)
+        self.message_log.remove_other_archives()
 
     def save_log(self, filename: str) -> None:
-        with open(filename, "wb") as f:
-            for message in self.message_log.messages:
-                f.write((message.full_text + "\n").encode())
+        self.message_log.save(filename)
 
     def handle_enemy_turns(self) -> None:
         """
@@ -96,38 +111,72 @@ class Engine:
         :return:
         """
         random.seed()
-        for entity in set(self.game_map.actors):
-            if entity.ai:
-                try:
-                    entity.ai.perform()
-                    entity.fighter.tick_energy()
-                    for effect in entity.status_effects:
-                        effect.tick()
-                except exceptions.Impossible:
-                    # TODO: make enemy print when their action is impossible if config set to debug
-                    pass  # Ignore impossible action exceptions from AI.
+        self.turn += 1
+        self.message_log.turn = self.turn
+        self.game_map.update_perception()
+        self.game_map.propagate_noise()
+        # Steps along paths are collected and resolved together once every
+        # enemy has acted, see CrowdMovement.
+        from Map.crowd_movement import CrowdMovement  # Imported here, actions imports back into the engine.
+        self.crowd_movement = CrowdMovement(self.game_map)
+        try:
+            for entity in set(self.game_map.actors):
+                if entity.ai:
+                    try:
+                        entity.ai.perform()
+                        entity.fighter.tick_energy()
+                        for effect in entity.status_effects:
+                            effect.tick()
+                    except exceptions.Impossible:
+                        # TODO: make enemy print when their action is impossible if config set to debug
+                        pass  # Ignore impossible action exceptions from AI.
+            self.crowd_movement.resolve()
+        finally:
+            self.crowd_movement = None
         if self.hasBoss:
             if self.boss.fighter.hp<1:
                 self.boss=None
                 self.hasBoss=False
                 self.play_song("viking1.mp3")
-                for x in range(1, self.game_map.width - 1):
-                    for y in range(1, self.game_map.height - 1):
-                        if self.game_map.tiles[x,y] == tile_types.floor_hidden_wall:
-                            self.game_map.tiles[x, y] = tile_types.floor
+                self.game_map.replace_tiles(tile_types.floor_hidden_wall, tile_types.floor)
 
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius=12,
-        )
-        # If a tile is "visible" it should be added to "explored".
-        self.game_map.explored |= self.game_map.visible
+        """Recompute the visible area based on the players point of view.
+
+        Results are cached on the map by viewpoint, radius and transparency
+        version, so turns where the player stands still cost nothing.
+        """
+        self.game_map.stream_around(self.player)
+        game_map = self.game_map
+        key = ((self.player.x, self.player.y), FOV_RADIUS, game_map.transparency_version)
+        if key == game_map.fov_key:
+            return  # Nothing that affects the FOV has changed.
+
+        entry = game_map.fov_cache.get(key)
+        if entry is None:
+            visible = compute_fov(
+                game_map.tiles["transparent"],
+                (self.player.x, self.player.y),
+                radius=FOV_RADIUS,
+            )
+            entry = game_map.fov_cache[key] = [visible, False]
+            if len(game_map.fov_cache) > FOV_CACHE_SIZE:
+                game_map.fov_cache.popitem(last=False)
+        else:
+            game_map.fov_cache.move_to_end(key)
+
+        game_map.visible[:] = entry[0]
+        # If a tile is "visible" it should be added to "explored". Explored
+        # only grows, so a result that was merged once never adds anything new.
+        if not entry[1]:
+            game_map.explored |= entry[0]
+            entry[1] = True
+        game_map.fov_key = key
+        game_map.update_visible_entities()
 
     def render(self, console: Console) -> None:
-        self.game_map.render(console, self.player.x, self.player.y)
+        self.camera.follow(self.game_map, self.player.x, self.player.y)
+        self.game_map.render(console, self.camera)
 
         self.message_log.render(console=console, x=21, y=45, width=40, height=5)
         render_functions.render_health_bar(
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import sys
 import textwrap
-from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union, Iterable
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING, Union, Iterable
 
 import os
 import tcod.event
@@ -12,13 +12,14 @@ from UI import color
 from actions import (
     Action,
     BumpAction,
+    MovementAction,
     PickupAction,
     WaitAction
 )
 import exceptions
 from Entities.entity import Item, Entity, Actor
 
-from Entities.Components.ai import ConfusedEnemy
+from Entities.Components.ai import CharmedEnemy, ConfusedEnemy
 from config import Config
 from UI.skills_render import render_skills
 
@@ -65,6 +66,9 @@ WAIT_KEYS = {
     tcod.event.K_CLEAR,
     tcod.event.K_SPACE,
 }
+# Turns a single auto-explore can take, the overworld never runs out of unexplored tiles.
+AUTO_EXPLORE_TURNS = 1000
+
 CONFIRM_KEYS = {
     tcod.event.K_RETURN,
     tcod.event.K_KP_ENTER,
@@ -106,17 +110,21 @@ class EventHandler(BaseEventHandler):
             return action_or_state
         if self.handle_action(action_or_state):
             # A valid action was performed.
-            if not self.engine.player.is_alive:
-                # The player was killed sometime during or after the action.
-                return GameOverEventHandler(self.engine)
-            elif self.engine.player.level.requires_level_up:
-                return LevelUpEventHandler(self.engine)
-            elif self.engine.pending_popup:
-                self.engine.pending_popup = False
-                return PopupMessage(self, self.engine.popuptext, self.engine.popuptitle, self.engine.popup_textcolor)
-            return MainGameEventHandler(self.engine)  # Return to the main handler.
+            return self.after_turn()
         return self
 
+    def after_turn(self) -> BaseEventHandler:
+        """Return the handler to switch to after the player took a turn."""
+        if not self.engine.player.is_alive:
+            # The player was killed sometime during or after the action.
+            return GameOverEventHandler(self.engine)
+        elif self.engine.player.level.requires_level_up:
+            return LevelUpEventHandler(self.engine)
+        elif self.engine.pending_popup:
+            self.engine.pending_popup = False
+            return PopupMessage(self, self.engine.popuptext, self.engine.popuptitle, self.engine.popup_textcolor)
+        return MainGameEventHandler(self.engine)  # Return to the main handler.
+
     def handle_action(self, action: Optional[Action]) -> bool:
         """Handle actions returned from event methods.
 
@@ -137,8 +145,9 @@ class EventHandler(BaseEventHandler):
         return True
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        location = self.engine.camera.screen_to_map(event.tile.x, event.tile.y)
+        if location is not None and self.engine.game_map.in_bounds(*location):
+            self.engine.mouse_location = location
 
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -202,6 +211,9 @@ class MainGameEventHandler(EventHandler):
         if key == tcod.event.K_PERIOD and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT) or \
                 (key == tcod.event.K_LESS and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT)):
             return actions.TakeStairsAction(player)
+        if key == tcod.event.K_COMMA and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT) or \
+                key == tcod.event.K_LESS:
+            return actions.TakeStairsAction(player)  # '<', up stairs.
 
         if key in MOVE_KEYS:
             dx, dy = MOVE_KEYS[key]
@@ -230,6 +242,8 @@ class MainGameEventHandler(EventHandler):
             return CharacterScreenEventHandler(self.engine)
         elif key == tcod.event.K_j:
             return SkillListHandler(self.engine)
+        elif key == tcod.event.K_x:
+            return self.auto_explore()
         if self.engine.config.values["AllowDebug"]:
             if key == tcod.event.K_o:
                 player.ai = ConfusedEnemy(
@@ -252,12 +266,82 @@ class MainGameEventHandler(EventHandler):
         # No valid key was pressed
         return action
 
+    def auto_explore(self) -> BaseEventHandler:
+        """Walk towards the nearest unexplored tile until something interesting happens.
+
+        Every step is a full turn, but nothing is drawn until exploring stops:
+        a monster comes into view, the player is hurt, a new item is seen, or
+        there is nothing left to reach.
+        """
+        engine = self.engine
+        player = engine.player
+        if isinstance(player.ai, ConfusedEnemy):
+            engine.message_log.add_message("You are too confused to explore.", color.impossible)
+            return self
+        if self.monster_in_view():
+            engine.message_log.add_message("Not with enemies in sight.", color.impossible)
+            return self
+
+        hp = player.fighter.hp
+        seen_items = {entity for entity in engine.game_map.visible_entities if isinstance(entity, Item)}
+        path: List[Tuple[int, int]] = []
+        path_key = None
+        turns = 0
+        for _ in range(AUTO_EXPLORE_TURNS):
+            game_map = engine.game_map
+            key = (game_map, game_map.transparency_version)
+            if not path or key != path_key or game_map.explored[path[-1]] or game_map.blocked[path[0]]:
+                # Replan once the tile being walked to was seen, or the map changed.
+                path = game_map.path_to_unexplored(player.x, player.y)
+                path_key = key
+                if not path:
+                    engine.message_log.add_message("There is nothing left to explore here.")
+                    break
+            dest_x, dest_y = path.pop(0)
+            if not self.handle_action(MovementAction(player, dest_x - player.x, dest_y - player.y)):
+                break
+            turns += 1
+
+            if not player.is_alive or player.level.requires_level_up or engine.pending_popup:
+                break
+            if player.fighter.hp < hp:
+                engine.message_log.add_message("You stop exploring, you are hurt!", color.impossible)
+                break
+            hp = player.fighter.hp  # Regeneration may have raised it, compare with the last step.
+            monster = self.monster_in_view()
+            if monster:
+                engine.message_log.add_message(f"The {monster.name} comes into view.", color.impossible)
+                break
+            items = [
+                entity for entity in engine.game_map.visible_entities
+                if isinstance(entity, Item) and entity not in seen_items
+            ]
+            if items:
+                article = "an" if items[0].name[:1].lower() in "aeiou" else "a"
+                engine.message_log.add_message(f"You spot {article} {items[0].name}.")
+                break
+        else:
+            engine.message_log.add_message("You stop to get your bearings.")
+
+        if turns:
+            return self.after_turn()
+        return self
+
+    def monster_in_view(self) -> Optional[Actor]:
+        """The nearest hostile actor the player can see. Charmed actors fight
+        for the player and don't count."""
+        for actor in self.engine.game_map.visible_actors:
+            if actor is not self.engine.player and not isinstance(actor.ai, CharmedEnemy):
+                return actor
+        return None
+
 
 class GameOverEventHandler(EventHandler):
     def on_quit(self) -> None:
         """Handle exiting out of a finished game."""
         if os.path.exists("savegame.sav"):
             os.remove("savegame.sav")  # Deletes the active save file.
+        self.engine.message_log.remove_archive()
         raise exceptions.QuitWithoutSaving()  # Avoid saving a finished game.
 
     def ev_quit(self, event: tcod.event.Quit) -> None:
@@ -282,19 +366,39 @@ CURSOR_X_KEYS = {
     tcod.event.K_RIGHT: 1,
 }
 
+# Off-screen consoles for the popup windows, kept between frames by size.
+_offscreen_consoles: Dict[Tuple[int, int], tcod.Console] = {}
+
+
+def offscreen_console(width: int, height: int) -> tcod.Console:
+    """Return a cleared off-screen console of the given size, reusing the one
+    drawn on by an earlier frame if there is one."""
+    log_console = _offscreen_consoles.get((width, height))
+    if log_console is None:
+        log_console = _offscreen_consoles[width, height] = tcod.Console(width, height)
+    else:
+        log_console.clear()
+    return log_console
+
 
 class HistoryViewer(EventHandler):
     """Print the history on a larger window which can be navigated."""
 
     def __init__(self, engine: Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
-        self.cursor = self.log_length - 1
+        # The cursor is the wrapped line shown at the bottom of the window.
+        # Line counts depend on the window width, so they are set up on the
+        # first render.
+        self.log_length = 0
+        self.cursor = -1
 
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)  # Draw the main state as the background.
 
-        log_console = tcod.Console(console.width - 6, console.height - 6)
+        log_console = offscreen_console(console.width - 6, console.height - 6)
+        if self.cursor < 0:
+            self.log_length = self.engine.message_log.line_count(log_console.width - 2)
+            self.cursor = self.log_length - 1
 
         # Draw a frame with a custom banner title.
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
@@ -303,13 +407,13 @@ class HistoryViewer(EventHandler):
         )
 
         # Render the message log using the cursor parameter.
-        self.engine.message_log.render_messages(
+        self.engine.message_log.render_history(
             log_console,
             1,
             1,
             log_console.width - 2,
             log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            self.cursor,
         )
         log_console.blit(console, 3, 3)
 
@@ -327,9 +431,9 @@ class HistoryViewer(EventHandler):
                 # Otherwise move while staying clamped to the bounds of the history log.
                 self.cursor = max(0, min(self.cursor + adjust, self.log_length - 1))
         elif event.sym == tcod.event.K_HOME:
-            self.cursor = 0  # Move directly to the top message.
+            self.cursor = 0  # Move directly to the top line.
         elif event.sym == tcod.event.K_END:
-            self.cursor = self.log_length - 1  # Move directly to the last message.
+            self.cursor = self.log_length - 1  # Move directly to the last line.
         else:  # Any other key moves back to the main game state.
             return MainGameEventHandler(self.engine)
         return None
@@ -555,9 +659,11 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
-        x, y = self.engine.mouse_location
-        console.tiles_rgb["bg"][x, y] = color.white
-        console.tiles_rgb["fg"][x, y] = color.black
+        camera = self.engine.camera
+        if camera.in_view(*self.engine.mouse_location):
+            x, y = camera.map_to_screen(*self.engine.mouse_location)
+            console.tiles_rgb["bg"][x, y] = color.white
+            console.tiles_rgb["fg"][x, y] = color.black
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         """Check for key movement or confirmation keys."""
@@ -575,10 +681,8 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Clamp the cursor index to the map size.
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.height - 1))
-            self.engine.mouse_location = x, y
+            # Clamp the cursor index to the part of the map on screen.
+            self.engine.mouse_location = self.engine.camera.clamp(x, y)
             return None
         elif key in CONFIRM_KEYS:
             return self.on_index_selected(*self.engine.mouse_location)
@@ -588,9 +692,10 @@ class SelectIndexHandler(AskUserEventHandler):
             self, event: tcod.event.MouseButtonDown
     ) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        location = self.engine.camera.screen_to_map(*event.tile)
+        if location is not None and self.engine.game_map.in_bounds(*location):
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*location)
         return super().ev_mousebuttondown(event)
 
     def on_index_selected(self, x: int, y: int) -> Optional[ActionOrHandler]:
@@ -623,7 +728,7 @@ class TileEntityListHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        log_console = tcod.Console(console.width - 6, console.height - 6)
+        log_console = offscreen_console(console.width - 6, console.height - 6)
 
         # Draw a frame with a custom banner title.
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
@@ -720,7 +825,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor."""
         super().on_render(console)
 
-        x, y = self.engine.mouse_location
+        x, y = self.engine.camera.map_to_screen(*self.engine.mouse_location)
 
         # Draw a rectangle around the targeted area, so the player can see the affected tiles.
         console.draw_frame(
@@ -746,6 +851,9 @@ class SkillTreeHandler(AskUserEventHandler):
         self.y_min=0
         self.y_max=50
         self.selected_skill_index=0
+        # Console tile under the mouse. The tree is drawn over the map, so
+        # this isn't engine.mouse_location, which is a map position.
+        self.mouse_location = (0, 0)
 
     def wrap(self, string: str, width: int) -> Iterable[str]:
         """Return a wrapped text message."""
@@ -757,14 +865,14 @@ class SkillTreeHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        log_console = tcod.Console(console.width, console.height)
+        log_console = offscreen_console(console.width, console.height)
 
         # Draw a frame with a custom banner title.
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
         log_console.print_box(
             0, 0, log_console.width, 1, f"┤{self.TITLE}├", alignment=tcod.CENTER
         )
-        m_x, m_y = self.engine.mouse_location
+        m_x, m_y = self.mouse_location
         for skill in self.engine.skills_list:
             if m_x>=skill.x and m_x<skill.x+5:
                 if m_y>=skill.y-self.y_offset+2 and m_y<skill.y-self.y_offset+7:
@@ -774,6 +882,9 @@ class SkillTreeHandler(AskUserEventHandler):
         render_skills(log_console,self.engine,self.y_offset+1,self.selected_skill_index)
 
         log_console.blit(console, 0, 0)
+    def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
+        self.mouse_location = event.tile.x, event.tile.y
+
     def level_skill(self,skill):
         if skill.level_up(self.engine.player):
             self.engine.player.skill_points-=1
@@ -782,7 +893,7 @@ class SkillTreeHandler(AskUserEventHandler):
             self, event: tcod.event.MouseButtonDown
     ) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        m_x, m_y = self.engine.mouse_location
+        m_x, m_y = self.mouse_location
         found_skill=None
         for skill in self.engine.skills_list:
             if m_x>=skill.x and m_x<skill.x+5:
@@ -1001,7 +1112,7 @@ class ItemInspectHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         super().on_render(console)
 
-        log_console = tcod.Console(console.width - 6, console.height - 6)
+        log_console = offscreen_console(console.width - 6, console.height - 6)
 
         # Draw a frame with a custom banner title.
         log_console.draw_frame(0, 0, log_console.width, log_console.height)
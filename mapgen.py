@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Generate a corpus of floors offline, for tuning and regression testing the
+map generators.
+
+    python mapgen.py --floors 100 --seed 1 --out corpus
+
+Each floor is written to `<out>/<generator>_<index>.npz` and a summary of
+every generator's output is written to `<out>/stats.json`. The same seed
+always produces the same corpus.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np  # type: ignore
+
+from Entities import entity_factories
+from Map.tile_types import TILE_NAMES, encode_tiles
+from Map.game_map import GameWorld
+from Map.procgen_cave import generate_cave2
+from Map.procgen_dungeon import generate_barracks, generate_dungeon, generate_temple
+from config import Config
+from engine import Engine
+
+GENERATORS = {
+    "cave": generate_cave2,
+    "dungeon": generate_dungeon,
+    "temple": generate_temple,
+    "barracks": generate_barracks,
+}
+
+_engine = None
+
+
+def _worker_engine(width: int, height: int, max_rooms: int, room_min_size: int, room_max_size: int) -> Engine:
+    """One headless engine per worker process, reused for every floor it makes."""
+    global _engine
+    if _engine is None:
+        _engine = Engine(player=copy.deepcopy(entity_factories.player), config=Config(), headless=True)
+        _engine.game_world = GameWorld(
+            engine=_engine,
+            max_rooms=max_rooms,
+            room_min_size=room_min_size,
+            room_max_size=room_max_size,
+            map_width=width,
+            map_height=height,
+        )
+    return _engine
+
+
+def generate_one(job: Tuple[str, int, int, int, dict]) -> Dict[str, object]:
+    """Generate and save one floor, returning its stats."""
+    kind, index, seed, depth, options = job
+    engine = _worker_engine(
+        options["width"], options["height"], options["max_rooms"],
+        options["room_min_size"], options["room_max_size"],
+    )
+    world = engine.game_world
+    world.current_floor = depth
+    random.seed(seed)
+    np.random.seed(seed)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # The generators print progress.
+        if kind == "cave":
+            dungeon = generate_cave2(map_width=world.map_width, map_height=world.map_height, engine=engine)
+        else:
+            dungeon = GENERATORS[kind](
+                max_rooms=world.max_rooms,
+                room_min_size=world.room_min_size,
+                room_max_size=world.room_max_size,
+                map_width=world.map_width,
+                map_height=world.map_height,
+                engine=engine,
+            )
+    elapsed = time.perf_counter() - start
+
+    report = dungeon.generation_report
+    entities = sorted(
+        (entity for entity in dungeon.entities if entity is not engine.player),
+        key=lambda entity: (entity.x, entity.y, entity.name),
+    )
+    np.savez_compressed(
+        os.path.join(options["out"], f"{kind}_{index:05d}.npz"),
+        tiles=encode_tiles(dungeon.tiles),
+        tile_names=np.array(TILE_NAMES),
+        entity_x=np.array([entity.x for entity in entities], dtype=np.int16),
+        entity_y=np.array([entity.y for entity in entities], dtype=np.int16),
+        entity_name=np.array([entity.name for entity in entities], dtype=str),
+        player=np.array([engine.player.x, engine.player.y], dtype=np.int16),
+        stairs=np.array(dungeon.downstairs_location, dtype=np.int16),
+        seed=np.array(seed, dtype=np.uint32),
+        depth=np.array(depth, dtype=np.int16),
+    )
+    return {
+        "kind": kind,
+        "seed": seed,
+        "seconds": elapsed,
+        "entities": len(entities),
+        "ok": report.ok,
+        "critical_path": report.critical_path,
+        "rejected": report.rejected,
+        "repaired": report.repaired_pockets,
+    }
+
+
+def summarize(results: List[Dict[str, object]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for kind in GENERATORS:
+        rows = [row for row in results if row["kind"] == kind]
+        if not rows:
+            continue
+        paths = [row["critical_path"] for row in rows if row["critical_path"] >= 0]
+        seconds = [row["seconds"] for row in rows]
+        summary[kind] = {
+            "floors": len(rows),
+            "failed": sum(not row["ok"] for row in rows),
+            "repaired": sum(row["repaired"] > 0 for row in rows),
+            "rejected": sum(row["rejected"] for row in rows),
+            "seconds_total": sum(seconds),
+            "seconds_mean": sum(seconds) / len(rows),
+            "seconds_max": max(seconds),
+            "entities_mean": sum(row["entities"] for row in rows) / len(rows),
+            "path_mean": sum(paths) / len(paths) if paths else -1,
+            "path_min": min(paths) if paths else -1,
+            "path_max": max(paths) if paths else -1,
+        }
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--floors", type=int, default=20, help="floors per generator")
+    parser.add_argument("--generators", default=",".join(GENERATORS), help="comma separated generator names")
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the corpus")
+    parser.add_argument("--depth", type=int, default=1, help="dungeon level the floors are generated for")
+    parser.add_argument("--out", default="map_corpus", help="output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--width", type=int, default=80)
+    parser.add_argument("--height", type=int, default=43)
+    parser.add_argument("--max-rooms", type=int, default=30)
+    parser.add_argument("--room-min-size", type=int, default=6)
+    parser.add_argument("--room-max-size", type=int, default=10)
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.generators.split(",") if kind.strip()]
+    for kind in kinds:
+        if kind not in GENERATORS:
+            parser.error(f"unknown generator {kind!r}, pick from {', '.join(GENERATORS)}")
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {
+        "out": args.out,
+        "width": args.width,
+        "height": args.height,
+        "max_rooms": args.max_rooms,
+        "room_min_size": args.room_min_size,
+        "room_max_size": args.room_max_size,
+    }
+    seeds = np.random.SeedSequence(args.seed).generate_state(len(kinds) * args.floors).tolist()
+    jobs = [
+        (kind, index, seeds[k * args.floors + index], args.depth, options)
+        for k, kind in enumerate(kinds)
+        for index in range(args.floors)
+    ]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(generate_one, jobs, chunksize=max(1, len(jobs) // (4 * (args.workers or 1)))))
+    wall_time = time.perf_counter() - start
+
+    summary = summarize(results)
+    with open(os.path.join(args.out, "stats.json"), "w") as f:
+        json.dump({"seed": args.seed, "depth": args.depth, "wall_seconds": wall_time,
+                   "generators": summary, "floors": results}, f, indent=1)
+
+    print(f"{len(results)} floors in {wall_time:.2f}s ({len(results) / wall_time:.1f} floors/s)")
+    for kind, stats in summary.items():
+        print(
+            f"{kind:>9}: {stats['floors']} floors, {stats['failed']} failed, {stats['repaired']} repaired, "
+            f"{stats['rejected']} rejected, {stats['seconds_mean'] * 1000:.1f}ms each, "
+            f"{stats['entities_mean']:.1f} entities, path {stats['path_mean']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
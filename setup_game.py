@@ -63,7 +63,7 @@ def new_game(config: Config) -> Engine:
         map_height=map_height,
     )
 
-    engine.game_world.load_surface(surfacefile)
+    engine.game_world.load_overworld(surfacefile)
     engine.update_fov()
 
     engine.message_log.add_message(